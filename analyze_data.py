@@ -0,0 +1,90 @@
+import argparse
+
+from common import (
+    check_files,
+    cleanup_files,
+    convert_patches,
+    convert_pulls,
+    convert_timelines,
+    force_refresh,
+    get_logger,
+    import_bots,
+    initialize,
+    selected,
+    toanalyze,
+)
+from cubes import build_cube, export_cube
+from measure_features_contributors import export_features_contributors, extract_features_contributors
+from measure_features_maintainers import export_features_maintainers, extract_features_maintainers
+from postprocess_data import collect_statistics, export_statistics
+from preprocess_data import export_patches, export_pulls, export_timelines, filter_data
+from process_data import export_dataset, export_summary, measure_statistics, process_timelines
+from scheduling import schedule
+
+initialize()
+
+
+def analyze_data(project, bots, owners, intermediates=False):
+    logger = get_logger(__file__, modules={"sqlitedict": "WARNING"})
+    logger.info(f"{project}: Analyzing data")
+    timelines, pulls, patches = filter_data(project)
+    if intermediates:
+        export_timelines(project, timelines)
+        export_pulls(project, pulls)
+        export_patches(project, patches)
+    timelines, pulls, patches = convert_timelines(timelines), convert_pulls(pulls), convert_patches(patches)
+    dataset = process_timelines(timelines, bots, owners)
+    export_dataset(project, dataset)
+    export_cube(project, build_cube(dataset))
+    export_summary(project, measure_statistics(project, dataset))
+    export_features_maintainers(project, extract_features_maintainers(project, dataset, pulls, patches))
+    export_features_contributors(project, extract_features_contributors(project, dataset, pulls, patches))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--intermediates", action="store_true", help="export preprocessed timelines, pulls and patches")
+    intermediates = parser.parse_known_args()[0].intermediates
+    files = [
+        "dataset_events",
+        "dataset_pulls",
+        "latency_cube",
+        "summary",
+        "process_state",
+        "features_maintainers",
+        "checkpoint_maintainers",
+        "chunks_maintainers",
+        "features_contributors",
+        "checkpoint_contributors",
+        "chunks_contributors",
+    ]
+    if intermediates:
+        files += ["timelines", "pulls", "patches"]
+    projects = []
+    analyzed = list(toanalyze())
+    for project in analyzed:
+        if cleanup_files(files, force_refresh(), project):
+            projects.append(project)
+        else:
+            print(f"Skip analyzing data for project {project}")
+    if projects:
+        schedule(
+            analyze_data,
+            projects,
+            bots=import_bots().index,
+            owners=[project.split("/")[0] for project in selected()],
+            intermediates=intermediates,
+        )
+        export_statistics(
+            collect_statistics(
+                [project for project in analyzed if check_files(["dataset_events", "dataset_pulls"], project)]
+            )
+        )
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("Stop analyzing data")
+        exit(1)
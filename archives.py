@@ -0,0 +1,69 @@
+import mmap
+import zlib
+
+import pandas as pd
+
+from common import get_path, open_patches_raw, open_patches_store, split_patch
+
+
+def import_archive_index(project):
+    if get_path("patches_index", project).exists():
+        return pd.read_parquet(get_path("patches_index", project))
+    return pd.DataFrame(
+        {
+            "pull_number": pd.Series(dtype="int64"),
+            "sha": pd.Series(dtype="object"),
+            "offset": pd.Series(dtype="int64"),
+            "length": pd.Series(dtype="int64"),
+            "compressed": pd.Series(dtype="bool"),
+        }
+    )
+
+
+def archive_patches(project, compress=False):
+    index = import_archive_index(project)
+    archived = set(index["pull_number"])
+    blocks = {sha: block for sha, *block in index[["sha", "offset", "length", "compressed"]].itertuples(index=False)}
+    patches = open_patches_raw(project)
+    store = open_patches_store(project) if get_path("patches_store", project).exists() else {}
+    rows = []
+    with open(get_path("patches_archive", project), "ab") as writer:
+        for pull_number, patch in patches.items():
+            if (pull_number := int(pull_number)) in archived:
+                continue
+            diffs = split_patch(patch) if isinstance(patch, str) else [(sha, store[sha]) for sha in patch]
+            for sha, diff in diffs:
+                if sha not in blocks:
+                    block = diff.encode()
+                    if compress:
+                        block = zlib.compress(block)
+                    blocks[sha] = [writer.tell(), len(block), compress]
+                    writer.write(block)
+                rows.append([pull_number, sha, *blocks[sha]])
+    index = pd.concat([index, pd.DataFrame(rows, columns=index.columns)], ignore_index=True)
+    index.astype({"pull_number": "int64", "offset": "int64", "length": "int64", "compressed": "bool"}).to_parquet(
+        get_path("patches_index", project), index=False
+    )
+
+
+def open_archive(project):
+    with open(get_path("patches_archive", project), "rb") as reader:
+        buffer = mmap.mmap(reader.fileno(), 0, access=mmap.ACCESS_READ) if reader.seek(0, 2) else b""
+    index = import_archive_index(project)
+    return {
+        "buffer": memoryview(buffer),
+        "pulls": index.groupby("pull_number", sort=False)["sha"].agg(list).to_dict(),
+        "blocks": {
+            sha: block for sha, *block in index[["sha", "offset", "length", "compressed"]].itertuples(index=False)
+        },
+    }
+
+
+def read_diff(archive, sha):
+    offset, length, compressed = archive["blocks"][sha]
+    block = archive["buffer"][offset : offset + length]
+    return zlib.decompress(block) if compressed else block
+
+
+def read_patch(archive, pull_number):
+    return [(sha, read_diff(archive, sha)) for sha in archive["pulls"].get(pull_number, [])]
@@ -1,25 +1,36 @@
+import argparse
+import math
+import sqlite3
+
 import github
 import joblib
 import requests
 
+from archives import archive_patches
 from common import (
     cleanup_files,
+    collected,
     connect_github,
     force_refresh,
     get_logger,
     get_path,
     initialize,
+    load_tokens,
     open_checkpoint,
     open_commits,
+    open_commits_store,
     open_metadata,
     open_patches_raw,
+    open_patches_store,
     open_pulls_raw,
     open_timelines_raw,
+    split_patch,
     tocollect,
-    tokens,
 )
+from profiler import merge_profiles, profiled, profiling_enabled
 
 initialize()
+PER_PAGE = 100
 
 
 def delete_pull(databases, pull):
@@ -32,6 +43,52 @@ def delete_pull(databases, pull):
             pass
 
 
+def reference_commits(commits, store):
+    for sha, commit in commits.items():
+        if sha not in store:
+            store[sha] = commit
+    return list(commits)
+
+
+def reference_patch(patch, store):
+    if not (diffs := split_patch(patch)):
+        return patch
+    for sha, diff in diffs:
+        if sha not in store:
+            store[sha] = diff
+    return [sha for sha, _ in diffs]
+
+
+def collect_pull(project, repository, pull, stores):
+    pulls, timelines, commits, patches, commits_store, patches_store = stores
+    pull_number = pull.number
+    pulls[pull_number] = pull.data
+    timelines[pull_number] = [event.data for event in repository.get_issue(pull_number).get_timeline()]
+    commits[pull_number] = reference_commits(
+        {commit.data["sha"]: commit.data for commit in pull.get_commits()}, commits_store
+    )
+    patches[pull_number] = reference_patch(
+        requests.get(f"https://patch-diff.githubusercontent.com/raw/{project}/pull/{pull_number}.patch").text,
+        patches_store,
+    )
+
+
+def deduplicate_data(project):
+    logger = get_logger(__file__, modules={"sqlitedict": "WARNING"})
+    logger.info(f"{project}: Deduplicating commits and patches")
+    with open_commits(project) as commits, open_commits_store(project) as store:
+        for pull_number in list(commits.keys()):
+            if isinstance(references := commits[pull_number], dict):
+                commits[pull_number] = reference_commits(references, store)
+    with open_patches_raw(project) as patches, open_patches_store(project) as store:
+        for pull_number in list(patches.keys()):
+            if isinstance(patch := patches[pull_number], str):
+                patches[pull_number] = reference_patch(patch, store)
+    for file in ["commits", "patches_raw"]:
+        with sqlite3.connect(get_path(file, project), isolation_level=None) as connection:
+            connection.execute("VACUUM")
+
+
 def collect_data(project):
     logger = get_logger(__file__, modules={"sqlitedict": "WARNING", "urllib3": "ERROR"})
     get_path("directory", project).mkdir(parents=True, exist_ok=True)
@@ -40,6 +97,8 @@ def collect_data(project):
     timelines = open_timelines_raw(project)
     commits = open_commits(project)
     patches = open_patches_raw(project)
+    commits_store = open_commits_store(project)
+    patches_store = open_patches_store(project)
     metadata = open_metadata(project)
     if checkpoint.get("last") is None:
         checkpoint["last"] = 0
@@ -52,7 +111,7 @@ def collect_data(project):
             logger.info(f"{project}: Collecting list of pull requests")
             repository = client.get_repo(project)
             for pull in repository.get_pulls(state="all", direction="asc")[checkpoint["last"] :]:
-                if client.rate_limiting[0] <= tokens[token]:
+                if client.rate_limiting[0] <= load_tokens()[token]:
                     raise github.RateLimitExceededException(
                         403, f"Reached custom rate limit for token {token}", headers=None
                     )
@@ -61,12 +120,9 @@ def collect_data(project):
                     delete_pull([pulls, timelines, commits, patches], pull_number)
                 else:
                     logger.info(f"{project}: Collecting data for pull request {pull_number}")
-                    pulls[pull_number] = pull.data
-                    timelines[pull_number] = [event.data for event in repository.get_issue(pull_number).get_timeline()]
-                    commits[pull_number] = {commit.data["sha"]: commit.data for commit in pull.get_commits()}
-                    patches[pull_number] = requests.get(
-                        f"https://patch-diff.githubusercontent.com/raw/{project}/pull/{pull_number}.patch"
-                    ).text
+                    collect_pull(
+                        project, repository, pull, [pulls, timelines, commits, patches, commits_store, patches_store]
+                    )
                 checkpoint["pull"] = pull_number
                 checkpoint["last"] += 1
         except (github.BadCredentialsException, github.RateLimitExceededException):
@@ -90,12 +146,130 @@ def collect_data(project):
     connect_github(token, done=True)
 
 
+def collect_shard(project, shard, checkpoint, stores):
+    logger = get_logger(__file__, modules={"sqlitedict": "WARNING", "urllib3": "ERROR"})
+    if checkpoint.get(f"pull_{shard}") is not None:
+        logger.info(
+            f"{project}: Last collected data in shard {shard} is for pull request {checkpoint[f'pull_{shard}']}"
+        )
+    stop = checkpoint[f"stop_{shard}"]
+    finished = False
+    token, client = connect_github()
+    while True:
+        try:
+            logger.info(f"{project}: Collecting list of pull requests in shard {shard}")
+            repository = client.get_repo(project)
+            listing = repository.get_pulls(state="all", direction="asc")
+            while stop is None or checkpoint[f"last_{shard}"] < stop:
+                last = checkpoint[f"last_{shard}"]
+                page = listing.get_page(last // PER_PAGE)
+                for pull in page[last % PER_PAGE :]:
+                    if client.rate_limiting[0] <= load_tokens()[token]:
+                        raise github.RateLimitExceededException(
+                            403, f"Reached custom rate limit for token {token}", headers=None
+                        )
+                    if (pull_number := pull.number) in checkpoint[f"exclude_{shard}"]:
+                        logger.info(f"{project}: Deleting data for pull request {pull_number}")
+                        delete_pull(list(stores[:4]), pull_number)
+                    else:
+                        logger.info(f"{project}: Collecting data for pull request {pull_number} in shard {shard}")
+                        collect_pull(project, repository, pull, stores)
+                    checkpoint[f"pull_{shard}"] = pull_number
+                    checkpoint[f"last_{shard}"] += 1
+                if len(page) < PER_PAGE:
+                    break
+        except (github.BadCredentialsException, github.RateLimitExceededException):
+            token, client = connect_github(token)
+        except github.UnknownObjectException:
+            logger.warning(f"{project}: Project does not exist")
+            break
+        except Exception as exception:
+            if (isinstance(exception, github.GithubException) and exception.status == 422) or isinstance(
+                exception, requests.exceptions.RetryError
+            ):
+                logger.warning(f"{project}: Skip collecting data for pull request {pull_number} due to {exception}")
+                checkpoint[f"exclude_{shard}"] = [pull_number, *checkpoint[f"exclude_{shard}"]]
+            else:
+                logger.error(f"{project}: Failed collecting data in shard {shard} due to {exception}")
+        else:
+            finished = True
+            logger.info(f"{project}: Finished collecting data in shard {shard}")
+            break
+    connect_github(token, done=True)
+    return finished
+
+
+def collect_sharded(project, shards):
+    logger = get_logger(__file__, modules={"sqlitedict": "WARNING", "urllib3": "ERROR"})
+    get_path("directory", project).mkdir(parents=True, exist_ok=True)
+    checkpoint = open_checkpoint(project)
+    if checkpoint.get("last") is not None:
+        logger.warning(f"{project}: Resuming unsharded collection")
+        checkpoint.close()
+        return collect_data(project)
+    stores = [
+        open_pulls_raw(project),
+        open_timelines_raw(project),
+        open_commits(project),
+        open_patches_raw(project),
+        open_commits_store(project),
+        open_patches_store(project),
+    ]
+    metadata = open_metadata(project)
+    if checkpoint.get("shards") is None:
+        token, client = connect_github()
+        pages = math.ceil(client.get_repo(project).get_pulls(state="all", direction="asc").totalCount / PER_PAGE)
+        connect_github(token, done=True)
+        for shard in range(shards):
+            checkpoint[f"last_{shard}"] = pages * shard // shards * PER_PAGE
+            checkpoint[f"stop_{shard}"] = pages * (shard + 1) // shards * PER_PAGE if shard < shards - 1 else None
+            checkpoint[f"exclude_{shard}"] = []
+        checkpoint["shards"] = shards
+    shards = checkpoint["shards"]
+    logger.info(f"{project}: Collecting data in {shards} shards")
+    with joblib.Parallel(n_jobs=shards, prefer="threads") as parallel:
+        finished = parallel(
+            joblib.delayed(collect_shard)(project, shard, checkpoint, stores) for shard in range(shards)
+        )
+    if all(finished):
+        token, client = connect_github()
+        metadata.update(client.get_repo(project).data)
+        connect_github(token, done=True)
+        checkpoint.terminate()
+        logger.info(f"{project}: Finished collecting data")
+
+
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shards", type=int, help="collect each project in shards of pull requests in parallel")
+    parser.add_argument("--deduplicate", action="store_true", help="move collected commits and patches to stores")
+    parser.add_argument("--archive", action="store_true", help="append collected patches to memory-mapped archives")
+    parser.add_argument("--compress", action="store_true", help="compress each commit block in patch archives")
+    arguments = parser.parse_known_args()[0]
+    if arguments.deduplicate or arguments.archive:
+        for project in collected():
+            if arguments.deduplicate:
+                deduplicate_data(project)
+            if arguments.archive:
+                archive_patches(project, compress=arguments.compress)
+        return
+    shards = arguments.shards
     projects = []
     for project in tocollect():
         if (
             cleanup_files(
-                ["checkpoint", "pulls_raw", "timelines_raw", "commits", "patches_raw", "metadata"],
+                [
+                    "checkpoint",
+                    "pulls_raw",
+                    "timelines_raw",
+                    "commits",
+                    "patches_raw",
+                    "commits_store",
+                    "patches_store",
+                    "patches_archive",
+                    "patches_index",
+                    "metadata",
+                ],
                 force_refresh(),
                 project,
             )
@@ -104,9 +278,16 @@ def main():
             projects.append(project)
         else:
             print(f"Skip collecting data for project {project}")
-    if projects:
-        with joblib.Parallel(n_jobs=len(tokens), prefer="threads", verbose=10) as parallel:
-            parallel(joblib.delayed(collect_data)(project) for project in projects)
+    profile = profiling_enabled()
+    if projects and shards:
+        for project in projects:
+            (profiled(collect_sharded, all_threads=True) if profile else collect_sharded)(project, shards)
+    elif projects:
+        with joblib.Parallel(n_jobs=len(load_tokens()), prefer="threads", verbose=10) as parallel:
+            collect = profiled(collect_data) if profile else collect_data
+            parallel(joblib.delayed(collect)(project) for project in projects)
+    if projects and profile:
+        merge_profiles("collect_data", projects)
 
 
 if __name__ == "__main__":
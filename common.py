@@ -1,38 +1,60 @@
 import argparse
-import csv
 import functools
+import importlib
 import json
 import logging
 import logging.config
 import os
 import pathlib
-import queue
+import pickle
+import re
 import sys
 
-import dateutil.relativedelta
-import github
-import github.GithubObject
-import pandas as pd
-import sqlitedict
-import urllib3
-import yaml
-
 sys.setrecursionlimit(1_000_000)
 logger = logging.getLogger(__name__)
-DATE = pd.Timestamp(2022, 12, 1)
-with open(pathlib.Path.home() / "tokens.yaml") as file:
-    tokens = yaml.safe_load(file)
-tokens_queue = queue.Queue()
-for token in tokens:
-    tokens_queue.put(token)
-
-
-@property
-def raw_data(self):
-    return self._rawData
-
-
-github.GithubObject.GithubObject.data = raw_data
+lazy = {
+    "common_collection": ["connect_github", "load_tokens"],
+    "common_analysis": [
+        "DATE",
+        "count_months",
+        "convert_dtypes",
+        "apply_schema",
+        "schemas",
+        "import_events",
+        "import_projects_fetched",
+        "import_projects",
+        "convert_timelines",
+        "convert_pulls",
+        "convert_patches",
+        "import_timelines",
+        "import_pulls",
+        "import_patches",
+        "import_bots",
+        "import_dataset",
+        "import_dataset_pulls",
+        "dataset_pulls_columns",
+        "import_summary",
+        "import_statistics",
+        "import_features_maintainers",
+        "import_features_contributors",
+        "tocollect",
+        "selected",
+        "collected",
+        "toanalyze",
+        "preprocessed",
+        "processed",
+        "measured_maintainers",
+        "measured_contributors",
+    ],
+    "common_query": ["connect_analytics", "bucket_latency", "query_frame"],
+}
+
+
+def __getattr__(name):
+    for module, names in lazy.items():
+        if name in names:
+            return getattr(importlib.import_module(module), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def initialize(directory=None):
@@ -94,56 +116,27 @@ def get_logger(name, level="INFO", modules=None):
     return logging.getLogger(name)
 
 
-def connect_github(token=None, done=False):
-    if done:
-        tokens_queue.put(token)
-    else:
-        if token is not None:
-            tokens_queue.put(token)
-        while True:
-            try:
-                token = tokens_queue.get()
-                client = github.Github(
-                    token,
-                    timeout=20,
-                    per_page=100,
-                    retry=urllib3.util.retry.Retry(
-                        total=None, status=10, status_forcelist=[500, 502, 503, 504], backoff_factor=1
-                    ),
-                )
-                remaining, limit = client.rate_limiting
-                if limit < 5000:
-                    raise github.BadCredentialsException(401, f"Token {token} is blocked", headers=None)
-            except github.BadCredentialsException:
-                logger.warning(f"Token {token} is not valid")
-            except github.RateLimitExceededException:
-                tokens_queue.put(token)
-            except Exception as exception:
-                logger.error(f"Token {token} is not working due to {exception}")
-                tokens_queue.put(token)
-            else:
-                if remaining > tokens[token]:
-                    break
-                else:
-                    tokens_queue.put(token)
-        return token, client
+@functools.cache
+def compile_keys(attributes):
+    if not isinstance(attributes, tuple):
+        attributes = (attributes,)
+    paths = [tuple(attribute.split(".")) for attribute in attributes]
 
+    def lookup(json):
+        for path in paths:
+            value = json
+            for key in path:
+                value = value.get(key) if value else None
+            if value not in [None, ""]:
+                return value
 
-def lookup_keys(attributes, json):
-    if not isinstance(attributes, list):
-        attributes = [attributes]
-    for attribute in attributes:
-        if (
-            value := functools.reduce(
-                lambda dictionary, key: dictionary.get(key) if dictionary else None, attribute.split("."), json
-            )
-        ) not in [None, ""]:
-            return value
+    return lookup
 
 
-def count_months(start, end):
-    delta = dateutil.relativedelta.relativedelta(end, start)
-    return delta.years * 12 + delta.months
+def lookup_keys(attributes, json):
+    if isinstance(attributes, list):
+        attributes = tuple(attributes)
+    return compile_keys(attributes)(json)
 
 
 def get_path(file, project=None):
@@ -155,6 +148,7 @@ def get_path(file, project=None):
         "data": "data/",
         # Generated in fetch_projects.py
         "projects_fetched": "projects_fetched.csv",
+        "projects_cache": "projects_cache.db",
         # Generated after selecting projects
         "projects": "projects.csv",
         # Generated in collect_data.py
@@ -164,22 +158,46 @@ def get_path(file, project=None):
         "timelines_raw": directory + f"{project}_timelines.db",
         "commits": directory + f"{project}_commits.db",
         "patches_raw": directory + f"{project}_patches.db",
+        "commits_store": directory + f"{project}_commits_store.db",
+        "patches_store": directory + f"{project}_patches_store.db",
+        "patches_archive": directory + f"{project}_patches.archive",
+        "patches_index": directory + f"{project}_patches_index.parquet",
         "metadata": directory + f"{project}.db",
+        # Generated in ingest_events.py
+        "changes": directory + f"{project}_changes.db",
         # Generated in preprocess_data.py
-        "timelines_fixed": directory + f"{project}_timelines_fixed.db",
         "timelines": directory + f"{project}_timelines.csv",
         "pulls": directory + f"{project}_pulls.csv",
         "patches": directory + f"{project}_patches.csv",
         # Generated manually
         "bots": "bots.csv",
+        # Generated in scheduling.py
+        "schedule": "schedule.csv",
         # Generated in process_data.py
-        "dataset": directory + f"{project}_dataset.csv",
+        "dataset_events": directory + f"{project}_dataset_events.parquet",
+        "dataset_pulls": directory + f"{project}_dataset_pulls.parquet",
+        "summary": directory + f"{project}_summary.json",
+        "process_state": directory + f"{project}_process_state.pkl",
+        "latency_cube": directory + f"{project}_latency_cube.parquet",
         # Generated in postprocess_data.py
         "statistics": "statistics.csv",
         # Generated in measure_features_maintainers.py
         "features_maintainers": directory + f"{project}_features_maintainers.csv",
+        "checkpoint_maintainers": directory + f"{project}_checkpoint_maintainers.db",
+        "chunks_maintainers": directory + f"{project}_chunks_maintainers.pkl",
+        # Generated in predict_latency.py
+        "model_maintainers": "model_maintainers.joblib",
+        # Generated in explanations.py
+        "explanations": "explanations/",
+        # Generated in profiler.py
+        "profiles": "profiles/",
+        # Generated in snapshots.py
+        "snapshots": directory + f"{project}_snapshots.archive",
+        "snapshots_index": directory + f"{project}_snapshots_index.parquet",
         # Generated in measure_features_contributors.py
         "features_contributors": directory + f"{project}_features_contributors.csv",
+        "checkpoint_contributors": directory + f"{project}_checkpoint_contributors.db",
+        "chunks_contributors": directory + f"{project}_chunks_contributors.pkl",
     }
     return pathlib.Path(files[file])
 
@@ -188,7 +206,7 @@ def force_refresh():
     parser = argparse.ArgumentParser()
     parser.add_argument("-y", action="store_true", help="force fresh start")
     parser.add_argument("-n", action="store_true", help="do not force fresh start")
-    if (args := parser.parse_args()).y:
+    if (args := parser.parse_known_args()[0]).y:
         return True
     elif args.n:
         return False
@@ -225,6 +243,8 @@ def check_files(files, project, exclude=None):
 
 
 def open_database(file):
+    import sqlitedict
+
     def encode(data):
         return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
 
@@ -234,36 +254,45 @@ def open_database(file):
     return sqlitedict.SqliteDict(file, tablename="data", autocommit=True, encode=encode, decode=decode)
 
 
-def convert_dtypes(function):
-    def wrapper(*args, **kwargs):
-        dataframe = function(*args, **kwargs)
-        for column in dataframe.filter(regex="^time|_at$"):
-            dataframe[column] = pd.to_datetime(dataframe[column]).dt.tz_localize(None)
-        dataframe = dataframe.convert_dtypes()
-        for column in dataframe.select_dtypes("string"):
-            if dataframe[column].nunique() < dataframe[column].count():
-                dataframe[column] = dataframe[column].astype("category")
-        return dataframe
+def open_projects_cache():
+    return open_database(get_path("projects_cache"))
 
-    return wrapper
 
+def open_checkpoint(project):
+    return open_database(get_path("checkpoint", project))
 
-def import_events(file):
-    return pd.read_json(file, lines=True)
 
+def open_checkpoint_maintainers(project):
+    return open_database(get_path("checkpoint_maintainers", project))
 
-@convert_dtypes
-def import_projects_fetched():
-    return pd.read_csv(get_path("projects_fetched"), index_col="project", low_memory=False)
 
+def open_checkpoint_contributors(project):
+    return open_database(get_path("checkpoint_contributors", project))
 
-@convert_dtypes
-def import_projects():
-    return pd.read_csv(get_path("projects"), index_col="project", low_memory=False)
 
+def append_chunk(file, chunk, offset):
+    with open(file, "ab") as writer:
+        writer.truncate(offset)
+        writer.seek(offset)
+        pickle.dump(chunk, writer, protocol=pickle.HIGHEST_PROTOCOL)
+        return writer.tell()
+
+
+def stamp_files(files, project):
+    stamps = []
+    for file in files:
+        path = get_path(file, project)
+        stamps.append([path.stat().st_mtime_ns, path.stat().st_size] if path.exists() else None)
+    return stamps
 
-def open_checkpoint(project):
-    return open_database(get_path("checkpoint", project))
+
+def import_chunks(file, offset):
+    records = []
+    if offset:
+        with open(file, "rb") as reader:
+            while reader.tell() < offset:
+                records.extend(pickle.load(reader))
+    return records
 
 
 def open_pulls_raw(project):
@@ -282,93 +311,60 @@ def open_patches_raw(project):
     return open_database(get_path("patches_raw", project))
 
 
-def open_metadata(project):
-    return open_database(get_path("metadata", project))
-
-
-def open_timelines_fixed(project):
-    return open_database(get_path("timelines_fixed", project))
-
+def open_commits_store(project):
+    return open_database(get_path("commits_store", project))
 
-@convert_dtypes
-def import_timelines(project):
-    return pd.read_csv(get_path("timelines", project), index_col=["pull_number", "event_number"], low_memory=False)
-
-
-@convert_dtypes
-def import_pulls(project):
-    return pd.read_csv(
-        get_path("pulls", project), index_col="number", quoting=csv.QUOTE_ALL, escapechar="\\", low_memory=False
-    )
 
+def open_patches_store(project):
+    return open_database(get_path("patches_store", project))
 
-@convert_dtypes
-def import_patches(project):
-    return pd.read_csv(get_path("patches", project), index_col=["pull_number", "sha"], low_memory=False)
 
-
-@convert_dtypes
-def import_bots():
-    return pd.read_csv(get_path("bots"), index_col="bot", low_memory=False)
-
-
-@convert_dtypes
-def import_dataset(project):
-    return pd.read_csv(get_path("dataset", project), index_col=["pull_number", "event_number"], low_memory=False)
-
-
-@convert_dtypes
-def import_statistics():
-    return pd.read_csv(get_path("statistics"), index_col="project", low_memory=False)
-
-
-@convert_dtypes
-def import_features_maintainers(project):
-    return pd.read_csv(get_path("features_maintainers", project), index_col=["pull_number"], low_memory=False)
-
-
-@convert_dtypes
-def import_features_contributors(project):
-    return pd.read_csv(get_path("features_contributors", project), index_col=["pull_number"], low_memory=False)
-
-
-def tocollect():
-    return import_projects_fetched().index
-
-
-def selected():
-    return import_projects().index
-
-
-def collected():
+def split_patch(patch):
     return [
-        project
-        for project in tocollect()
-        if check_files(
-            ["pulls_raw", "timelines_raw", "commits", "patches_raw", "metadata"], project, exclude="checkpoint"
+        (re.match(r"(?ms)^From (\S+) Mon Sep 17 00:00:00 2001$.+?^---$", diff).group(1), diff)
+        for diff in re.findall(
+            (
+                r"(?ms)^From \S+ Mon Sep 17 00:00:00 2001$.+?^---$.+?(?=^From \S+ Mon Sep 17 00:00:00 2001$.+?^---$)"
+                r"|^From \S+ Mon Sep 17 00:00:00 2001$.+?^---$.+"
+            ),
+            patch,
         )
     ]
 
 
-def toanalyze():
-    return selected().intersection(collected())
+def open_changes(project):
+    return open_database(get_path("changes", project))
 
 
-def preprocessed():
-    return [
-        project
-        for project in toanalyze()
-        if check_files(["timelines", "pulls", "patches"], project, exclude="timelines_fixed")
-    ]
-
-
-def processed():
-    return [project for project in preprocessed() if check_files("dataset", project)]
-
-
-def measured_maintainers():
-    return [project for project in processed() if check_files("features_maintainers", project)]
+def open_metadata(project):
+    return open_database(get_path("metadata", project))
 
 
-def measured_contributors():
-    return [project for project in processed() if check_files("features_contributors", project)]
+__all__ = [
+    "append_chunk",
+    "check_files",
+    "cleanup_files",
+    "compile_keys",
+    "force_refresh",
+    "get_logger",
+    "get_path",
+    "import_chunks",
+    "initialize",
+    "lookup_keys",
+    "open_changes",
+    "open_checkpoint",
+    "open_checkpoint_contributors",
+    "open_checkpoint_maintainers",
+    "open_commits",
+    "open_commits_store",
+    "open_database",
+    "open_metadata",
+    "open_patches_raw",
+    "open_patches_store",
+    "open_projects_cache",
+    "open_pulls_raw",
+    "open_timelines_raw",
+    "split_patch",
+    "stamp_files",
+]
+__all__ += [name for names in lazy.values() for name in names]
@@ -0,0 +1,255 @@
+import csv
+import json
+import os
+
+import dateutil.relativedelta
+import pandas as pd
+
+from common import check_files, get_path
+
+DATE = pd.Timestamp(2022, 12, 1)
+VALIDATE = os.environ.get("VALIDATE_SCHEMA") == "1"
+schemas = {
+    "timelines": {
+        "event": "category",
+        "actor": "category",
+        "time": "datetime64[ns]",
+        "state": "category",
+        "commit_id": "string",
+        "referenced": "boolean",
+        "sha": "string",
+    },
+    "pulls": {
+        "html_url": "string",
+        "title": "string",
+        "body": "string",
+    },
+    "patches": {
+        "added_lines": "Int64",
+        "deleted_lines": "Int64",
+        "changed_files": "Int64",
+    },
+    "dataset": {
+        "event": "category",
+        "actor": "category",
+        "time": "datetime64[ns]",
+        "sha": "string",
+        "is_open": "boolean",
+        "is_closed": "boolean",
+        "is_merged": "boolean",
+        "opened_at": "datetime64[ns]",
+        "closed_at": "datetime64[ns]",
+        "merged_at": "datetime64[ns]",
+        "closed_by": "category",
+        "merged_by": "category",
+        "resolved_at": "datetime64[ns]",
+        "resolved_by": "category",
+        "is_contributor": "boolean",
+        "is_maintainer": "boolean",
+        "is_bot": "boolean",
+        "is_maintainer_response": "boolean",
+        "maintainer_responded_at": "datetime64[ns]",
+        "maintainer_responded_by": "category",
+        "maintainer_responded_event": "category",
+        "maintainer_latency": "Float64",
+        "is_contributor_response": "boolean",
+        "contributor_responded_at": "datetime64[ns]",
+        "contributor_responded_event": "category",
+        "contributor_latency": "Float64",
+    },
+}
+dataset_pulls_columns = [
+    "is_open",
+    "is_closed",
+    "is_merged",
+    "opened_at",
+    "closed_at",
+    "merged_at",
+    "closed_by",
+    "merged_by",
+    "resolved_at",
+    "resolved_by",
+    "maintainer_responded_at",
+    "maintainer_responded_by",
+    "maintainer_responded_event",
+    "maintainer_latency",
+    "contributor_responded_at",
+    "contributor_responded_event",
+    "contributor_latency",
+]
+
+
+def count_months(start, end):
+    delta = dateutil.relativedelta.relativedelta(end, start)
+    return delta.years * 12 + delta.months
+
+
+def convert_dtypes(function):
+    def wrapper(*args, **kwargs):
+        dataframe = function(*args, **kwargs)
+        for column in dataframe.filter(regex="^time|_at$"):
+            dataframe[column] = pd.to_datetime(dataframe[column]).dt.tz_localize(None)
+        dataframe = dataframe.convert_dtypes()
+        for column in dataframe.select_dtypes("string"):
+            if dataframe[column].nunique() < dataframe[column].count():
+                dataframe[column] = dataframe[column].astype("category")
+        return dataframe
+
+    return wrapper
+
+
+def validate_schema(dataframe, schema):
+    if mismatches := [
+        f"{column} ({dtype})"
+        for column, dtype in dataframe.dtypes.items()
+        if column not in schema or dtype != schema[column]
+    ]:
+        raise TypeError(f"Columns do not match schema: {', '.join(mismatches)}")
+
+
+def apply_schema(name):
+    def decorator(function):
+        def wrapper(*args, **kwargs):
+            dataframe = function(*args, **kwargs)
+            for column, dtype in schemas[name].items():
+                if column in dataframe and dataframe[column].dtype != dtype:
+                    if dtype == "datetime64[ns]":
+                        dataframe[column] = pd.to_datetime(dataframe[column]).dt.tz_localize(None)
+                    else:
+                        dataframe[column] = dataframe[column].astype(dtype)
+            if VALIDATE:
+                validate_schema(dataframe, schemas[name])
+            return dataframe
+
+        return wrapper
+
+    return decorator
+
+
+def import_events(file, chunksize=None):
+    return pd.read_json(file, lines=True, chunksize=chunksize)
+
+
+@convert_dtypes
+def import_projects_fetched():
+    return pd.read_csv(get_path("projects_fetched"), index_col="project", low_memory=False)
+
+
+@convert_dtypes
+def import_projects():
+    return pd.read_csv(get_path("projects"), index_col="project", low_memory=False)
+
+
+@apply_schema("timelines")
+def convert_timelines(timelines):
+    return timelines.set_index(["pull_number", "event_number"])
+
+
+@apply_schema("pulls")
+def convert_pulls(pulls):
+    return pulls.set_index("number")
+
+
+@apply_schema("patches")
+def convert_patches(patches):
+    return patches.set_index(["pull_number", "sha"])
+
+
+def import_timelines(project):
+    return convert_timelines(pd.read_csv(get_path("timelines", project), low_memory=False))
+
+
+def import_pulls(project):
+    return convert_pulls(
+        pd.read_csv(get_path("pulls", project), quoting=csv.QUOTE_ALL, escapechar="\\", low_memory=False)
+    )
+
+
+def import_patches(project):
+    return convert_patches(pd.read_csv(get_path("patches", project), low_memory=False))
+
+
+@convert_dtypes
+def import_bots():
+    return pd.read_csv(get_path("bots"), index_col="bot", low_memory=False)
+
+
+def pulls_filters(pulls):
+    if pulls is not None:
+        return [("pull_number", ">=", pulls.start), ("pull_number", "<", pulls.stop)]
+
+
+@apply_schema("dataset")
+def import_dataset_pulls(project, columns=None, pulls=None):
+    return pd.read_parquet(get_path("dataset_pulls", project), columns=columns, filters=pulls_filters(pulls))
+
+
+@apply_schema("dataset")
+def import_dataset(project, columns=None, pulls=None):
+    if columns is None:
+        columns_events, columns_pulls = None, dataset_pulls_columns
+    else:
+        columns_events = [column for column in columns if column not in dataset_pulls_columns]
+        columns_pulls = [column for column in columns if column in dataset_pulls_columns]
+    events = pd.read_parquet(get_path("dataset_events", project), columns=columns_events, filters=pulls_filters(pulls))
+    if columns_pulls:
+        events = events.join(import_dataset_pulls(project, columns_pulls, pulls), on="pull_number")
+    return events
+
+
+def import_summary(project):
+    with open(get_path("summary", project)) as file:
+        return json.load(file)
+
+
+@convert_dtypes
+def import_statistics():
+    return pd.read_csv(get_path("statistics"), index_col="project", low_memory=False)
+
+
+@convert_dtypes
+def import_features_maintainers(project):
+    return pd.read_csv(get_path("features_maintainers", project), index_col=["pull_number"], low_memory=False)
+
+
+@convert_dtypes
+def import_features_contributors(project):
+    return pd.read_csv(get_path("features_contributors", project), index_col=["pull_number"], low_memory=False)
+
+
+def tocollect():
+    return import_projects_fetched().index
+
+
+def selected():
+    return import_projects().index
+
+
+def collected():
+    return [
+        project
+        for project in tocollect()
+        if check_files(
+            ["pulls_raw", "timelines_raw", "commits", "patches_raw", "metadata"], project, exclude="checkpoint"
+        )
+    ]
+
+
+def toanalyze():
+    return selected().intersection(collected())
+
+
+def preprocessed():
+    return [project for project in toanalyze() if check_files(["timelines", "pulls", "patches"], project)]
+
+
+def processed():
+    return [project for project in toanalyze() if check_files(["dataset_events", "dataset_pulls"], project)]
+
+
+def measured_maintainers():
+    return [project for project in processed() if check_files("features_maintainers", project)]
+
+
+def measured_contributors():
+    return [project for project in processed() if check_files("features_contributors", project)]
@@ -0,0 +1,65 @@
+import logging
+import pathlib
+import queue
+
+import github
+import github.GithubObject
+import urllib3
+import yaml
+
+logger = logging.getLogger(__name__)
+tokens = {}
+tokens_queue = queue.Queue()
+
+
+@property
+def raw_data(self):
+    return self._rawData
+
+
+github.GithubObject.GithubObject.data = raw_data
+
+
+def load_tokens():
+    if not tokens:
+        with open(pathlib.Path.home() / "tokens.yaml") as file:
+            tokens.update(yaml.safe_load(file))
+        for token in tokens:
+            tokens_queue.put(token)
+    return tokens
+
+
+def connect_github(token=None, done=False):
+    load_tokens()
+    if done:
+        tokens_queue.put(token)
+    else:
+        if token is not None:
+            tokens_queue.put(token)
+        while True:
+            try:
+                token = tokens_queue.get()
+                client = github.Github(
+                    token,
+                    timeout=20,
+                    per_page=100,
+                    retry=urllib3.util.retry.Retry(
+                        total=None, status=10, status_forcelist=[500, 502, 503, 504], backoff_factor=1
+                    ),
+                )
+                remaining, limit = client.rate_limiting
+                if limit < 5000:
+                    raise github.BadCredentialsException(401, f"Token {token} is blocked", headers=None)
+            except github.BadCredentialsException:
+                logger.warning(f"Token {token} is not valid")
+            except github.RateLimitExceededException:
+                tokens_queue.put(token)
+            except Exception as exception:
+                logger.error(f"Token {token} is not working due to {exception}")
+                tokens_queue.put(token)
+            else:
+                if remaining > tokens[token]:
+                    break
+                else:
+                    tokens_queue.put(token)
+        return token, client
@@ -0,0 +1,45 @@
+import numpy as np
+
+from common import get_path
+
+
+def quote_literal(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def connect_analytics(projects, files, threads=None):
+    import duckdb
+
+    connection = duckdb.connect()
+    if threads is not None:
+        connection.execute(f"SET threads = {int(threads)}")
+    for file in files:
+        paths = {project: get_path(file, project).resolve() for project in projects}
+        if all(path.suffix == ".csv" for path in paths.values()):
+            source = (
+                f"SELECT * FROM read_csv([{', '.join(quote_literal(path) for path in paths.values())}],"
+                " header = true, union_by_name = true)"
+            )
+        else:
+            source = " UNION ALL BY NAME ".join(
+                f"SELECT {quote_literal(project)} AS project, * FROM read_parquet({quote_literal(path)})"
+                for project, path in paths.items()
+            )
+        connection.execute(f"CREATE OR REPLACE VIEW {file} AS {source}")
+    return connection
+
+
+def bucket_latency(column, bins, labels):
+    cases = [
+        (
+            f"WHEN {column} > {lower} AND {column} <= {upper} THEN {quote_literal(label)}"
+            if upper != np.inf
+            else f"WHEN {column} > {lower} THEN {quote_literal(label)}"
+        )
+        for lower, upper, label in zip(bins, bins[1:], labels)
+    ]
+    return f"CASE {' '.join(cases)} END"
+
+
+def query_frame(connection, query, parameters=None):
+    return connection.execute(query, parameters).df()
@@ -0,0 +1,131 @@
+import numpy as np
+import pandas as pd
+import scipy.sparse
+
+from common import cleanup_files, force_refresh, get_logger, get_path, import_dataset, initialize, processed
+from scheduling import schedule
+
+initialize()
+ACCURACY = 0.01
+GAMMA = (1 + ACCURACY) / (1 - ACCURACY)
+MINIMUM = 1 / 3600
+BUCKETS = int(np.ceil(np.log(24 * 365 * 30 / MINIMUM) / np.log(GAMMA))) + 1
+DIMENSIONS = ["project", "month", "latency", "is_bot", "event"]
+
+
+def bucket_latencies(latencies):
+    buckets = np.ceil(np.log(np.maximum(latencies, MINIMUM) / MINIMUM) / np.log(GAMMA))
+    return np.clip(buckets, 0, BUCKETS - 1).astype(np.int16)
+
+
+def bucket_values(buckets):
+    return MINIMUM * 2 * GAMMA**buckets / (GAMMA + 1)
+
+
+def build_cube(dataset):
+    pulled = dataset.query("event == 'pulled'")
+    cells = []
+    for latency in ["maintainer", "contributor"]:
+        responded = pulled[pulled[f"{latency}_latency"].notna()]
+        cells.append(
+            pd.DataFrame(
+                {
+                    "month": responded["opened_at"].dt.to_period("M").dt.to_timestamp(),
+                    "latency": latency,
+                    "is_bot": responded["is_bot"].to_numpy(bool),
+                    "event": responded[f"{latency}_responded_event"].astype(str).to_numpy(),
+                    "bucket": bucket_latencies(responded[f"{latency}_latency"].to_numpy(float)),
+                }
+            )
+        )
+    return pd.concat(cells).groupby(DIMENSIONS[1:] + ["bucket"]).size().rename("count").reset_index()
+
+
+def export_cube(project, cube):
+    cube.to_parquet(get_path("latency_cube", project), index=False)
+
+
+def import_cube(projects):
+    cube = pd.concat(
+        [pd.read_parquet(get_path("latency_cube", project)).assign(project=project) for project in projects],
+        ignore_index=True,
+    )
+    cells = cube.groupby(DIMENSIONS, sort=False).ngroup().to_numpy()
+    first = cube.drop_duplicates(DIMENSIONS)
+    return {
+        "cells": {dimension: first[dimension].to_numpy() for dimension in DIMENSIONS},
+        "counts": scipy.sparse.csr_array(
+            (cube["count"].to_numpy(), (cells, cube["bucket"].to_numpy())), shape=(len(first), BUCKETS)
+        ),
+    }
+
+
+def select_cells(cube, start=None, end=None, **filters):
+    cells = cube["cells"]
+    selected = np.ones(len(cells["project"]), dtype=bool)
+    for dimension, values in filters.items():
+        selected &= np.isin(cells[dimension], np.atleast_1d(values))
+    if start is not None:
+        selected &= cells["month"] >= np.datetime64(pd.Timestamp(start))
+    if end is not None:
+        selected &= cells["month"] < np.datetime64(pd.Timestamp(end))
+    return selected
+
+
+def rank_buckets(counts, quantiles):
+    totals = counts.sum(axis=1)
+    cumulative = counts.cumsum(axis=1)
+    values = {"count": totals}
+    for quantile in quantiles:
+        ranks = quantile * (totals - 1)
+        buckets = (cumulative <= ranks[:, None]).sum(axis=1)
+        values[quantile] = np.where(totals > 0, bucket_values(np.minimum(buckets, BUCKETS - 1)), np.nan)
+    return values
+
+
+def query_percentiles(cube, quantiles=(0.5,), by=None, start=None, end=None, **filters):
+    selected = select_cells(cube, start, end, **filters)
+    counts = cube["counts"][selected]
+    if by is None:
+        return pd.Series({key: value[0] for key, value in rank_buckets(counts.sum(axis=0)[None], quantiles).items()})
+    keys = pd.DataFrame({dimension: cube["cells"][dimension][selected] for dimension in np.atleast_1d(by)})
+    groups = keys.groupby(list(keys.columns)).ngroup().to_numpy()
+    index = keys.drop_duplicates().set_index(list(keys.columns)).sort_index().index
+    indicator = scipy.sparse.csr_array(
+        (np.ones(len(groups), dtype=int), (groups, np.arange(len(groups)))), shape=(len(index), len(groups))
+    )
+    return pd.DataFrame(rank_buckets((indicator @ counts).toarray(), quantiles), index=index)
+
+
+def measure_cube(project):
+    logger = get_logger(__file__)
+    logger.info(f"{project}: Building latency cube")
+    columns = [
+        "event",
+        "opened_at",
+        "is_bot",
+        "maintainer_latency",
+        "maintainer_responded_event",
+        "contributor_latency",
+        "contributor_responded_event",
+    ]
+    export_cube(project, build_cube(import_dataset(project, columns)))
+
+
+def main():
+    projects = []
+    for project in processed():
+        if cleanup_files("latency_cube", force_refresh(), project):
+            projects.append(project)
+        else:
+            print(f"Skip building latency cube for project {project}")
+    if projects:
+        schedule(measure_cube, projects)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("Stop building latency cubes")
+        exit(1)
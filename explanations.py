@@ -0,0 +1,90 @@
+import hashlib
+import os
+import tempfile
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from common import get_path
+
+BATCH = 100_000
+
+
+def hash_frames(*frames):
+    digest = hashlib.blake2b(digest_size=16)
+    for frame in frames:
+        digest.update(pd.util.hash_pandas_object(frame).to_numpy().tobytes())
+        digest.update(repr(list(frame.columns) if isinstance(frame, pd.DataFrame) else frame.name).encode())
+    return digest.hexdigest()
+
+
+def hash_model(model):
+    with tempfile.TemporaryDirectory() as directory:
+        model.save_model(os.path.join(directory, "model.cbm"))
+        with open(os.path.join(directory, "model.cbm"), "rb") as reader:
+            return hashlib.blake2b(reader.read(), digest_size=16).hexdigest()
+
+
+def hash_parameters(model):
+    import catboost
+
+    parameters = {key: value for key, value in model.get_params().items() if key not in ["thread_count", "silent"]}
+    return hashlib.blake2b(repr([catboost.__version__, sorted(parameters.items())]).encode(), digest_size=8).hexdigest()
+
+
+def fit_model(X, y, thread_count=-1):
+    import catboost
+
+    get_path("explanations").mkdir(exist_ok=True)
+    model = catboost.CatBoostClassifier(
+        objective="MultiClassOneVsAll", random_state=1, thread_count=thread_count, silent=True
+    )
+    if not (path := get_path("explanations") / f"model_{hash_frames(X, y)}_{hash_parameters(model)}.cbm").exists():
+        model.fit(X, y).save_model(path)
+    return model.load_model(path)
+
+
+def compute_shap_values(model, X, approximate=False, thread_count=-1):
+    import catboost
+
+    values = [
+        model.get_feature_importance(
+            catboost.Pool(X.iloc[start : start + BATCH]),
+            type="ShapValues",
+            shap_calc_type="Approximate" if approximate else "Regular",
+            thread_count=thread_count,
+        )
+        for start in range(0, len(X), BATCH)
+    ]
+    values = np.concatenate(values)
+    if values.ndim == 3:
+        return values[:, :, :-1].transpose(0, 2, 1)
+    return values[:, :-1]
+
+
+def explain_model(model, X, sample=None, approximate=False, thread_count=-1):
+    if sample is not None and sample < len(X):
+        X = X.iloc[np.sort(np.random.default_rng(1).choice(len(X), sample, replace=False))]
+    get_path("explanations").mkdir(exist_ok=True)
+    path = get_path("explanations") / f"shap_{hash_model(model)}_{hash_frames(X)}_{int(approximate)}.npy"
+    if path.exists():
+        return np.load(path), X
+    values = compute_shap_values(model, X, approximate, thread_count)
+    np.save(path, values)
+    return values, X
+
+
+def explain_split(X, y, train_index=None, test_index=None, sample=None, approximate=False, thread_count=-1):
+    X_train, y_train = (X, y) if train_index is None else (X.iloc[train_index], y.iloc[train_index])
+    X_test = X if test_index is None else X.iloc[test_index]
+    return explain_model(fit_model(X_train, y_train, thread_count), X_test, sample, approximate, thread_count)
+
+
+def explain_splits(splits, n_jobs=-1, sample=None, approximate=False):
+    thread_count = -1 if n_jobs == 1 else 1
+    with joblib.Parallel(n_jobs=n_jobs) as parallel:
+        return parallel(
+            joblib.delayed(explain_split)(*split, sample=sample, approximate=approximate, thread_count=thread_count)
+            for split in splits
+        )
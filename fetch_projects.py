@@ -1,11 +1,34 @@
+import argparse
+import json
+
 import github
 import joblib
 import pandas as pd
 
-from common import cleanup_files, connect_github, force_refresh, get_logger, get_path, initialize, tokens
+from common import (
+    cleanup_files,
+    connect_github,
+    force_refresh,
+    get_logger,
+    get_path,
+    initialize,
+    load_tokens,
+    open_projects_cache,
+)
 
 initialize()
 logger = get_logger(__file__, modules={"urllib3": "ERROR"})
+QUERY = "stars:>19000 sort:stars"
+BATCH = 50
+FIELDS = "nameWithOwner stargazerCount isArchived isFork pullRequests { totalCount }"
+SEARCH = f"""
+query($query: String!, $cursor: String) {{
+  search(query: $query, type: REPOSITORY, first: 100, after: $cursor) {{
+    pageInfo {{ hasNextPage endCursor }}
+    nodes {{ ... on Repository {{ {FIELDS} }} }}
+  }}
+}}
+"""
 
 
 def fetch_projects():
@@ -51,6 +74,111 @@ def fetch_metadata(project):
     return metadata
 
 
+def query_graphql(client, query, variables=None):
+    headers, data = client.requester.requestJsonAndCheck(
+        "POST", client.requester.graphql_url, input={"query": query, "variables": variables or {}}
+    )
+    if any(error.get("type") == "RATE_LIMITED" for error in data.get("errors", [])):
+        raise github.RateLimitExceededException(403, data, headers=headers)
+    return data
+
+
+def parse_metadata(project, repository):
+    return {
+        "project": project,
+        "pulls": repository["pullRequests"]["totalCount"],
+        "stars": repository["stargazerCount"],
+        "archived": repository["isArchived"],
+        "fork": repository["isFork"],
+    }
+
+
+def is_fresh(entry, max_age):
+    return entry is not None and pd.Timestamp.now(tz="UTC") - pd.Timestamp(entry["fetched_at"]) <= pd.Timedelta(
+        hours=max_age
+    )
+
+
+def cache_metadata(cache, metadata):
+    fetched_at = pd.Timestamp.now(tz="UTC").isoformat()
+    for entry in metadata:
+        cache[entry["project"]] = {**entry, "fetched_at": fetched_at}
+
+
+def search_metadata(query=QUERY):
+    metadata = []
+    cursor = None
+    token, client = connect_github()
+    while True:
+        try:
+            logger.info(f"Fetching list of projects from result {len(metadata)}")
+            search = query_graphql(client, SEARCH, {"query": query, "cursor": cursor})["data"]["search"]
+            page = [parse_metadata(node["nameWithOwner"].lower(), node) for node in search["nodes"] if node]
+        except (github.BadCredentialsException, github.RateLimitExceededException):
+            token, client = connect_github(token)
+        except Exception as exception:
+            logger.error(f"Failed fetching list of projects due to {exception}")
+        else:
+            metadata.extend(page)
+            cursor = search["pageInfo"]["endCursor"]
+            if not search["pageInfo"]["hasNextPage"]:
+                break
+    connect_github(token, done=True)
+    return metadata
+
+
+def discover_projects(cache, max_age, query=QUERY):
+    if is_fresh(entry := cache.get(f"query:{query}"), max_age):
+        logger.info(f"Reuse cached list of {len(entry['projects'])} projects")
+        return entry["projects"]
+    metadata = search_metadata(query)
+    cache_metadata(cache, metadata)
+    projects = list(dict.fromkeys(entry["project"] for entry in metadata))
+    cache[f"query:{query}"] = {"projects": projects, "fetched_at": pd.Timestamp.now(tz="UTC").isoformat()}
+    return projects
+
+
+def batch_query(projects):
+    aliases = [
+        f"repository{i}: repository(owner: {json.dumps(owner)}, name: {json.dumps(name)}) {{ {FIELDS} }}"
+        for i, (owner, name) in enumerate(project.split("/", 1) for project in projects)
+    ]
+    return "query { " + " ".join(aliases) + " }"
+
+
+def fetch_metadata_batched(projects, cache, max_age):
+    pending = [project for project in projects if not is_fresh(cache.get(project), max_age)]
+    logger.info(f"Fetching metadata of {len(pending)} projects with {len(projects) - len(pending)} cached")
+    failed = set()
+    token, client = connect_github()
+    for start in range(0, len(pending), BATCH):
+        batch = pending[start : start + BATCH]
+        while True:
+            try:
+                logger.info(f"Fetching metadata of projects {start + 1} to {start + len(batch)}")
+                repositories = query_graphql(client, batch_query(batch))["data"] or {}
+            except (github.BadCredentialsException, github.RateLimitExceededException):
+                token, client = connect_github(token)
+            except Exception as exception:
+                logger.error(f"Failed fetching metadata of projects due to {exception}")
+            else:
+                break
+        for i, project in enumerate(batch):
+            if (repository := repositories.get(f"repository{i}")) is None:
+                logger.error(f"{project}: Failed fetching metadata")
+                failed.add(project)
+            else:
+                cache_metadata(cache, [parse_metadata(project, repository)])
+    connect_github(token, done=True)
+    metadata = []
+    for project in projects:
+        if project in failed:
+            metadata.append({"project": project, "pulls": None, "stars": None, "archived": None, "fork": None})
+        else:
+            metadata.append({key: value for key, value in cache[project].items() if key != "fetched_at"})
+    return metadata
+
+
 def export_projects(metadata):
     pd.DataFrame(metadata).sort_values(["pulls", "stars"], ascending=False).to_csv(
         get_path("projects_fetched"), index=False
@@ -58,9 +186,22 @@ def export_projects(metadata):
 
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rest", action="store_true", help="fetch metadata per project through the REST API")
+    parser.add_argument("--candidates", help="CSV file of additional projects to fetch metadata for")
+    parser.add_argument("--max-age", type=float, default=24, help="hours before cached metadata is fetched again")
+    arguments = parser.parse_known_args()[0]
     if cleanup_files("projects_fetched", force_refresh()):
-        with joblib.Parallel(n_jobs=len(tokens), prefer="threads", verbose=10) as parallel:
-            export_projects(parallel(joblib.delayed(fetch_metadata)(project) for project in fetch_projects()))
+        if arguments.rest:
+            with joblib.Parallel(n_jobs=len(load_tokens()), prefer="threads", verbose=10) as parallel:
+                export_projects(parallel(joblib.delayed(fetch_metadata)(project) for project in fetch_projects()))
+        else:
+            with open_projects_cache() as cache:
+                projects = discover_projects(cache, arguments.max_age)
+                if arguments.candidates is not None:
+                    candidates = pd.read_csv(arguments.candidates)["project"].str.lower()
+                    projects = list(dict.fromkeys([*projects, *candidates]))
+                export_projects(fetch_metadata_batched(projects, cache, arguments.max_age))
     else:
         print("Skip fetching projects")
 
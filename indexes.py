@@ -0,0 +1,167 @@
+import collections
+import hashlib
+import math
+
+import numpy as np
+import pandas as pd
+
+PRECISION = 12
+
+
+def to_times(series):
+    return series.to_numpy("datetime64[ns]", na_value=np.datetime64("NaT"))
+
+
+def count_before(times, time):
+    return int(np.searchsorted(times, time, side="left"))
+
+
+def index_backlog(pulled):
+    opened_at = to_times(pulled["opened_at"])
+    resolved_at = to_times(pulled["resolved_at"])
+    is_open = pulled["is_open"].to_numpy(bool)
+    ended_at = np.where(np.isnat(resolved_at), opened_at, np.maximum(opened_at, resolved_at))[~is_open]
+    return {"opened_at": np.sort(opened_at), "ended_at": np.sort(ended_at)}
+
+
+def count_backlog(backlog, time):
+    time = np.datetime64(time, "ns")
+    return count_before(backlog["opened_at"], time) - count_before(backlog["ended_at"], time)
+
+
+def backlog_series(backlog, freq="D"):
+    times = pd.date_range(backlog["opened_at"][0], backlog["opened_at"][-1], freq=freq)
+    counts = np.searchsorted(backlog["opened_at"], times, side="left") - np.searchsorted(
+        backlog["ended_at"], times, side="left"
+    )
+    return pd.Series(counts, index=times, name="backlog")
+
+
+def index_history(pulled):
+    history = {}
+    for actor, pulls in pulled.groupby("actor", observed=True):
+        opened_at = to_times(pulls["opened_at"])
+        merged_at = to_times(pulls["merged_at"])
+        responded_at = to_times(pulls["contributor_responded_at"])
+        latency = pulls["contributor_latency"].to_numpy("float64", na_value=np.nan)
+        merged = ~np.isnat(merged_at)
+        responded = ~np.isnat(responded_at) & ~np.isnan(latency)
+        responded_at = np.maximum(opened_at, responded_at)[responded]
+        order = np.argsort(responded_at, kind="stable")
+        history[actor] = {
+            "backlog": index_backlog(pulls),
+            "merged_at": np.sort(np.maximum(opened_at, merged_at)[merged]),
+            "responded_at": responded_at[order],
+            "latency": latency[responded][order],
+        }
+    return history
+
+
+def query_history(history, actor, time):
+    if (records := history.get(actor)) is None:
+        return 0, 0, 0, 0
+    time = np.datetime64(time, "ns")
+    pulls = count_before(records["backlog"]["opened_at"], time)
+    open_pulls = count_backlog(records["backlog"], time)
+    acceptance_rate = count_before(records["merged_at"], time) / pulls if pulls else 0
+    responded = count_before(records["responded_at"], time)
+    median_latency = np.median(records["latency"][:responded]) if responded else 0
+    return pulls, open_pulls, acceptance_rate, median_latency
+
+
+def hash_actor(actor):
+    value = int.from_bytes(hashlib.blake2b(str(actor).encode(), digest_size=8).digest(), "big")
+    register = value >> (64 - PRECISION)
+    rest = value & (2 ** (64 - PRECISION) - 1)
+    return register, 64 - PRECISION - rest.bit_length() + 1
+
+
+def create_window(approximate):
+    if approximate:
+        registers = 2**PRECISION
+        return {
+            "registers": [collections.deque() for _ in range(registers)],
+            "maxima": [0] * registers,
+            "sum": registers << 64,
+            "zeros": registers,
+        }
+    return {}
+
+
+def update_register(window, register):
+    maximum = window["registers"][register][0][1] if window["registers"][register] else 0
+    if maximum != (previous := window["maxima"][register]):
+        window["sum"] += (1 << (64 - maximum)) - (1 << (64 - previous))
+        window["zeros"] += (maximum == 0) - (previous == 0)
+        window["maxima"][register] = maximum
+
+
+def add_actor(window, actor, time, hashes):
+    if hashes is None:
+        window[actor] = time
+    else:
+        register, rank = hashes[actor]
+        entries = window["registers"][register]
+        while entries and entries[-1][1] <= rank:
+            entries.pop()
+        entries.append((time, rank))
+        update_register(window, register)
+
+
+def restore_actor(window, actor, time, hashes):
+    if hashes is None:
+        window.setdefault(actor, time)
+    else:
+        register, rank = hashes[actor]
+        entries = window["registers"][register]
+        if not entries or entries[0][1] < rank:
+            entries.appendleft((time, rank))
+            update_register(window, register)
+
+
+def remove_actor(window, actor, last, hashes):
+    if hashes is None:
+        if window.get(actor, last) < last:
+            del window[actor]
+    else:
+        register, _ = hashes[actor]
+        entries = window["registers"][register]
+        while entries and entries[0][0] < last:
+            entries.popleft()
+        update_register(window, register)
+
+
+def count_actors(window, hashes):
+    if hashes is None:
+        return len(window)
+    registers = len(window["maxima"])
+    estimate = (0.7213 / (1 + 1.079 / registers)) * registers**2 / (window["sum"] / 2**64)
+    if estimate <= 2.5 * registers and window["zeros"]:
+        estimate = registers * math.log(registers / window["zeros"])
+    return round(estimate)
+
+
+def count_window_actors(events, times, months=3, approximate=False):
+    events = events.query("not is_bot and time.notna()").sort_values("time", kind="stable")
+    actors = events["actor"].astype("category")
+    hashes = [hash_actor(actor) for actor in actors.cat.categories] if approximate else None
+    actors = actors.cat.codes.tolist()
+    is_maintainer = events["is_maintainer"].to_numpy(int).tolist()
+    events_times = to_times(events["time"]).astype("int64").tolist()
+    times = times.dropna().sort_values(kind="stable")
+    lasts = to_times(times - pd.DateOffset(months=months)).astype("int64").tolist()
+    windows = [create_window(approximate), create_window(approximate)]
+    counts = np.zeros((len(times), 2), dtype=int)
+    start = end = 0
+    for i, (time, last) in enumerate(zip(to_times(times).astype("int64").tolist(), lasts)):
+        while end < len(events_times) and events_times[end] < time:
+            add_actor(windows[is_maintainer[end]], actors[end], events_times[end], hashes)
+            end += 1
+        while start < end and events_times[start] < last:
+            remove_actor(windows[is_maintainer[start]], actors[start], last, hashes)
+            start += 1
+        while start > 0 and events_times[start - 1] >= last:
+            start -= 1
+            restore_actor(windows[is_maintainer[start]], actors[start], events_times[start], hashes)
+        counts[i] = [count_actors(windows[1], hashes), count_actors(windows[0], hashes)]
+    return pd.DataFrame(counts, index=times.index, columns=["project_maintainers", "project_community"])
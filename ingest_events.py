@@ -0,0 +1,162 @@
+import argparse
+import collections
+import copy
+import json
+import queue
+import sys
+import threading
+
+import pandas as pd
+
+from collect_data import reference_commits, reference_patch
+from common import (
+    get_logger,
+    get_path,
+    import_events,
+    initialize,
+    open_changes,
+    open_commits,
+    open_commits_store,
+    open_patches_raw,
+    open_patches_store,
+    open_pulls_raw,
+    open_timelines_raw,
+)
+from preprocess_data import filter_patches, fix_timeline, lookup_columns, lookup_pull_columns, resolve_commits
+
+initialize()
+
+
+def clean_record(record):
+    return {key: value for key, value in record.items() if not (isinstance(value, float) and pd.isna(value))}
+
+
+def read_events(files, size, batches):
+    try:
+        for file in files:
+            with import_events(file, chunksize=size) as reader:
+                for chunk in reader:
+                    batches.put([clean_record(record) for record in chunk.to_dict("records")])
+    except Exception as exception:
+        batches.put(exception)
+    else:
+        batches.put(None)
+
+
+def open_stores(project):
+    get_path("directory", project).mkdir(parents=True, exist_ok=True)
+    return {
+        "pulls": open_pulls_raw(project),
+        "timelines": open_timelines_raw(project),
+        "commits": open_commits(project),
+        "commits_store": open_commits_store(project),
+        "patches": open_patches_raw(project),
+        "patches_store": open_patches_store(project),
+        "changes": open_changes(project),
+    }
+
+
+def append_events(stores, pull_number, events):
+    timeline = stores["timelines"].get(pull_number, [])
+    seen = {json.dumps(event, sort_keys=True) for event in timeline}
+    for event in events:
+        if (key := json.dumps(event, sort_keys=True)) not in seen:
+            seen.add(key)
+            timeline.append(event)
+    return timeline
+
+
+def ingest_batch(project, stores, events):
+    logger = get_logger(__file__, modules={"sqlitedict": "WARNING"})
+    touched = {}
+    for record in events:
+        changes = touched.setdefault(
+            int(record["pull_number"]), {"pull": None, "commits": {}, "events": [], "patch": None}
+        )
+        if (pull := record.get("pull")) is not None:
+            changes["pull"] = pull
+        if (commit := record.get("commit")) is not None:
+            changes["commits"][commit["sha"]] = commit
+        if (event := record.get("event")) is not None:
+            changes["events"].append(event)
+        if (patch := record.get("patch")) is not None:
+            changes["patch"] = patch
+    ingested = 0
+    for pull_number, changes in touched.items():
+        if (pull := changes["pull"]) is None and (pull := stores["pulls"].get(pull_number)) is None:
+            logger.warning(
+                f"{project}: Skip {len(changes['events'])} events of pull request {pull_number} without pull data"
+            )
+            continue
+        existing = len(stores["timelines"].get(pull_number, []))
+        timeline = append_events(stores, pull_number, changes["events"])
+        commits = changes["commits"]
+        if isinstance(references := stores["commits"].get(pull_number, []), dict):
+            commits = {**references, **commits}
+        references = list(dict.fromkeys([*references, *commits]))
+        columns = {column: [] for column in lookup_columns}
+        try:
+            fix_timeline(
+                copy.deepcopy(timeline),
+                pull,
+                resolve_commits(references, collections.ChainMap(commits, stores["commits_store"])),
+                columns,
+            )
+        except (KeyError, TypeError, AttributeError) as exception:
+            logger.warning(f"{project}: Skip events of pull request {pull_number} due to {exception!r}")
+            continue
+        if changes["pull"] is not None:
+            stores["pulls"][pull_number] = pull
+        reference_commits(commits, stores["commits_store"])
+        if (patch := changes["patch"]) is not None:
+            stores["patches"][pull_number] = reference_patch(patch, stores["patches_store"])
+            patch = filter_patches({pull_number: patch}, None).to_dict("list")
+        stores["timelines"][pull_number] = timeline
+        stores["commits"][pull_number] = references
+        stores["changes"][pull_number] = {
+            "timelines": columns,
+            "pulls": {column: lookup(pull) for column, lookup in lookup_pull_columns.items()},
+            "patches": patch,
+        }
+        ingested += len(timeline) - existing
+    logger.info(f"{project}: Ingested {ingested} events of {len(touched)} pull requests")
+
+
+def ingest_events(files, size=1000, backlog=4):
+    batches = queue.Queue(maxsize=backlog)
+    reader = threading.Thread(target=read_events, args=(files, size, batches), daemon=True)
+    reader.start()
+    stores = {}
+    try:
+        while (batch := batches.get()) is not None:
+            if isinstance(batch, Exception):
+                raise batch
+            projects = {}
+            for record in batch:
+                projects.setdefault(record["project"], []).append(record)
+            for project, events in projects.items():
+                if project not in stores:
+                    stores[project] = open_stores(project)
+                ingest_batch(project, stores[project], events)
+    finally:
+        for project in stores.values():
+            for store in project.values():
+                store.close()
+    reader.join()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("files", nargs="+", help="JSONL files of timeline events, or - for stdin")
+    parser.add_argument("--batch", type=int, default=1000, help="number of events per micro-batch")
+    parser.add_argument("--backlog", type=int, default=4, help="number of micro-batches read ahead")
+    arguments = parser.parse_args()
+    ingest_events([file if file != "-" else sys.stdin for file in arguments.files], arguments.batch, arguments.backlog)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("Stop ingesting events")
+        exit(1)
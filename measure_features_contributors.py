@@ -1,33 +1,45 @@
-import joblib
 import pandas as pd
 
 from common import (
+    append_chunk,
     cleanup_files,
     force_refresh,
     get_logger,
     get_path,
+    import_chunks,
     import_dataset,
     import_patches,
     import_pulls,
     initialize,
+    open_checkpoint_contributors,
     processed,
+    stamp_files,
 )
+from indexes import count_backlog, count_window_actors, index_backlog, index_history, query_history
+from scheduling import schedule
 
 initialize()
+CHUNK = 100
 
 
 def export_features_contributors(project, features):
     pd.DataFrame(features).to_csv(get_path("features_contributors", project), index=False)
+    cleanup_files(["checkpoint_contributors", "chunks_contributors"], True, project)
 
 
-def measure_features_contributors(project):
-    logger = get_logger(__file__)
-    logger.info(f"{project}: Measuring features contributors")
-    dataset = import_dataset(project)
-    pulls = import_pulls(project)
-    patches = import_patches(project)
+def extract_features_contributors(project, dataset, pulls, patches):
+    pulled_all = dataset.query("event == 'pulled'")
+    history = index_history(pulled_all)
+    backlog = index_backlog(pulled_all)
+    windows = count_window_actors(dataset, pulled_all["maintainer_responded_at"].droplevel("event_number"))
+    checkpoint = open_checkpoint_contributors(project)
+    stamp = stamp_files(["dataset_events", "dataset_pulls", "pulls", "patches"], project)
+    if checkpoint.get("stamp") != stamp:
+        checkpoint["stamp"] = stamp
+        checkpoint["progress"] = [0, 0]
+    done, offset = checkpoint["progress"]
     features_all = []
-    for pull_number in dataset.index.unique("pull_number"):
+    for pull_number in dataset.index.unique("pull_number")[done:]:
         timeline = dataset.query("pull_number == @pull_number")
         pulled = timeline.query("event == 'pulled'")
         contributor = pulled["actor"].iat[0]
@@ -87,24 +99,16 @@ def measure_features_contributors(project):
                     pr_changed_lines += patch["added_lines"].iat[0] + patch["deleted_lines"].iat[0]
                     pr_changed_files += patch["changed_files"].iat[0]
             past_pulled = events.query("event == 'pulled'")
-            pulled_contributor = past_pulled.query("actor == @contributor")
-            contributor_pulls = len(pulled_contributor)
-            contributor_open_pulls = len(pulled_contributor.query("is_open or resolved_at >= @maintainer_responded_at"))
-            contributor_acceptance_rate = (
-                len(pulled_contributor.query("merged_at < @maintainer_responded_at")) / contributor_pulls
-                if contributor_pulls
-                else 0
-            )
-            contributor_median_latency = pulled_contributor.query(
-                "contributor_responded_at < @maintainer_responded_at"
-            )["contributor_latency"].median()
-            contributor_median_latency = contributor_median_latency if pd.notna(contributor_median_latency) else 0
+            (
+                contributor_pulls,
+                contributor_open_pulls,
+                contributor_acceptance_rate,
+                contributor_median_latency,
+            ) = query_history(history, contributor, maintainer_responded_at)
             last = maintainer_responded_at - pd.DateOffset(months=3)  # noqa: F841
             project_pulls = len(past_pulled.query("opened_at >= @last"))
-            project_open_pulls = len(past_pulled.query("is_open or resolved_at >= @maintainer_responded_at"))
-            events_last = events.query("time >= @last")
-            project_maintainers = events_last.query("is_maintainer and not is_bot")["actor"].nunique()
-            project_community = events_last.query("not is_maintainer and not is_bot")["actor"].nunique()
+            project_open_pulls = count_backlog(backlog, maintainer_responded_at)
+            project_maintainers, project_community = windows.loc[pull_number]
             project_median_latency = past_pulled.query(
                 "maintainer_responded_at < @maintainer_responded_at and maintainer_responded_at >= @last"
             )["maintainer_latency"].median()
@@ -145,19 +149,41 @@ def measure_features_contributors(project):
                 }
             )
         features_all.append(features)
-    export_features_contributors(project, features_all)
+        if len(features_all) == CHUNK:
+            offset = append_chunk(get_path("chunks_contributors", project), features_all, offset)
+            done += len(features_all)
+            checkpoint["progress"] = [done, offset]
+            features_all = []
+    checkpoint.close()
+    return import_chunks(get_path("chunks_contributors", project), offset) + features_all
+
+
+def measure_features_contributors(project):
+    logger = get_logger(__file__, modules={"sqlitedict": "WARNING"})
+    if get_path("checkpoint_contributors", project).exists():
+        logger.info(f"{project}: Resuming measuring features contributors")
+    else:
+        logger.info(f"{project}: Measuring features contributors")
+    export_features_contributors(
+        project,
+        extract_features_contributors(project, import_dataset(project), import_pulls(project), import_patches(project)),
+    )
 
 
 def main():
     projects = []
     for project in processed():
-        if cleanup_files("features_contributors", force_refresh(), project):
+        if (
+            cleanup_files(
+                ["features_contributors", "checkpoint_contributors", "chunks_contributors"], force_refresh(), project
+            )
+            or get_path("checkpoint_contributors", project).exists()
+        ):
             projects.append(project)
         else:
             print(f"Skip measuring features contributors for project {project}")
     if projects:
-        with joblib.Parallel(n_jobs=-1, verbose=50) as parallel:
-            parallel(joblib.delayed(measure_features_contributors)(project) for project in projects)
+        schedule(measure_features_contributors, projects)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+
+
+def permute_feature(values, feature, n_repeats, seed):
+    generator = np.random.RandomState(seed)
+    indices = np.arange(len(values))
+    permuted = values[:, feature]
+    copies = np.repeat(values[None], n_repeats, axis=0)
+    for repeat in range(n_repeats):
+        generator.shuffle(indices)
+        permuted = permuted[indices]
+        copies[repeat, :, feature] = permuted
+    return copies
+
+
+def rank_curves(scores, y):
+    order = np.argsort(-scores, axis=1, kind="mergesort")
+    scores = np.take_along_axis(scores, order, axis=1)
+    tps = np.cumsum(y[order], axis=1)
+    fps = np.arange(1, scores.shape[1] + 1) - tps
+    distinct = np.ones_like(scores, dtype=bool)
+    distinct[:, :-1] = scores[:, :-1] != scores[:, 1:]
+    previous = [
+        np.maximum.accumulate(np.pad(np.where(distinct, counts, 0)[:, :-1], ((0, 0), (1, 0))), axis=1)
+        for counts in [tps, fps]
+    ]
+    return distinct, tps, fps, *previous
+
+
+def roc_auc_scores(scores, y):
+    if (positives := y.sum()) in [0, len(y)]:
+        raise ValueError("Only one class present in y_true. ROC AUC score is not defined in that case.")
+    distinct, tps, fps, tps_previous, fps_previous = rank_curves(scores, y)
+    areas = np.where(distinct, (fps - fps_previous) * (tps + tps_previous), 0)
+    return areas.sum(axis=1) / (2 * positives * (len(y) - positives))
+
+
+def average_precision_scores(scores, y):
+    if not (positives := y.sum()):
+        return np.zeros(len(scores))
+    distinct, tps, fps, tps_previous, _ = rank_curves(scores, y)
+    return np.where(distinct, (tps - tps_previous) * tps / (tps + fps), 0).sum(axis=1) / positives
+
+
+ovr_metrics = {"roc_auc_ovr": roc_auc_scores, "average_precision_ovr": average_precision_scores}
+
+
+def score_ovr(metric, y, probabilities, classes):
+    flat = probabilities.reshape(-1, *probabilities.shape[-2:])
+    scores = [ovr_metrics[metric](flat[:, :, i], np.asarray(y) == label) for i, label in enumerate(classes)]
+    return np.mean(scores, axis=0).reshape(probabilities.shape[:-2])
+
+
+def score_metric(metric, y, probabilities, classes):
+    if isinstance(metric, str):
+        return score_ovr(metric, y, probabilities, classes)
+    return np.array([metric(y, repeat) for repeat in probabilities.reshape(-1, *probabilities.shape[-2:])]).reshape(
+        probabilities.shape[:-2]
+    )
+
+
+def permutation_importances(model, X, y, metrics, n_repeats=10, random_state=1):
+    seed = np.random.RandomState(random_state).randint(np.iinfo(np.int32).max + 1)
+    values = X.to_numpy()
+    baseline = model.predict_proba(X)
+    scores = {name: score_metric(metric, y, baseline, model.classes_) for name, metric in metrics.items()}
+    importances = {name: np.empty((X.shape[1], n_repeats)) for name in metrics}
+    # Predict one feature at a time so only its repeats of X are held in memory, not those of every feature
+    for feature in range(X.shape[1]):
+        copies = permute_feature(values, feature, n_repeats, seed)
+        probabilities = model.predict_proba(pd.DataFrame(copies.reshape(-1, X.shape[1]), columns=X.columns))
+        probabilities = probabilities.reshape(n_repeats, len(X), -1)
+        for name, metric in metrics.items():
+            importances[name][feature] = scores[name] - score_metric(metric, y, probabilities, model.classes_)
+    return importances
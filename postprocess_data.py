@@ -1,17 +1,17 @@
-import joblib
 import pandas as pd
 
 from common import (
     cleanup_files,
-    count_months,
     force_refresh,
     get_logger,
     get_path,
     import_dataset,
+    import_summary,
     initialize,
-    open_metadata,
     processed,
 )
+from process_data import export_summary, measure_statistics
+from scheduling import schedule
 
 initialize()
 
@@ -19,26 +19,35 @@ initialize()
 def postprocess_data(project):
     logger = get_logger(__file__, modules={"sqlitedict": "WARNING"})
     logger.info(f"{project}: Postprocessing data")
-    dataset = import_dataset(project)
-    metadata = open_metadata(project)
-    pulled = dataset.query("event == 'pulled'")
-    return {
-        "project": project,
-        "language": metadata["language"],
-        "stars": metadata["watchers"],
-        "age": count_months(pd.Timestamp(metadata["created_at"]).tz_localize(None), pulled["time"].max()),
-        "contributors": pulled["actor"].nunique(),
-        "maintainers": dataset.query("is_maintainer")["actor"].nunique(),
-        "bots": dataset.query("is_bot")["actor"].nunique(),
-        "bot contributors": pulled.query("is_bot")["actor"].nunique(),
-        "bot maintainers": dataset.query("is_bot and is_maintainer")["actor"].nunique(),
-        "pulls": len(pulled),
-        "open": len(pulled.query("is_open")),
-        "closed": len(pulled.query("is_closed")),
-        "merged": len(pulled.query("is_merged")),
-        "maintainer responded": len(pulled.query("maintainer_latency.notna()")),
-        "contributor responded": len(pulled.query("contributor_latency.notna()")),
-    }
+    dataset = import_dataset(
+        project,
+        [
+            "event",
+            "actor",
+            "time",
+            "is_open",
+            "is_closed",
+            "is_merged",
+            "is_maintainer",
+            "is_bot",
+            "maintainer_latency",
+            "contributor_latency",
+        ],
+    )
+    export_summary(project, measure_statistics(project, dataset))
+
+
+def is_stale(project):
+    return not get_path("summary", project).exists() or any(
+        get_path("summary", project).stat().st_mtime < get_path(file, project).stat().st_mtime
+        for file in ["dataset_events", "dataset_pulls"]
+    )
+
+
+def collect_statistics(projects):
+    if stale := [project for project in projects if is_stale(project)]:
+        schedule(postprocess_data, stale)
+    return [import_summary(project) for project in projects]
 
 
 def export_statistics(statistics):
@@ -47,8 +56,7 @@ def export_statistics(statistics):
 
 def main():
     if cleanup_files("statistics", force_refresh()):
-        with joblib.Parallel(n_jobs=-1, verbose=50) as parallel:
-            export_statistics(parallel(joblib.delayed(postprocess_data)(project) for project in processed()))
+        export_statistics(collect_statistics(processed()))
     else:
         print("Skip postprocessing data")
 
@@ -0,0 +1,353 @@
+import argparse
+import bisect
+import collections
+import itertools
+import json
+import statistics
+import sys
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from common import (
+    get_logger,
+    get_path,
+    import_bots,
+    import_dataset,
+    import_dataset_pulls,
+    import_events,
+    import_features_maintainers,
+    import_pulls,
+    initialize,
+    measured_maintainers,
+    selected,
+)
+from process_data import contributor_responses, maintainer_events, maintainer_responses
+
+initialize()
+
+labels = ["(1) Within 1 Day", "(2) 1 Day to 1 Week", "(3) More than 1 Week"]
+characteristics = [
+    "pr_hour",
+    "pr_day",
+    "pr_description",
+    "pr_commits",
+    "contributor_open_pulls",
+    "contributor_acceptance_rate",
+    "contributor_median_latency",
+    "project_open_pulls",
+    "project_maintainers",
+    "project_community",
+    "project_median_latency",
+]
+
+
+def train_model(features):
+    import catboost
+    import sklearn.calibration
+    import sklearn.frozen
+
+    features = features.query("not is_bot and contributor != 'ghost' and maintainer_latency > 0")
+    X = features[characteristics]
+    y = pd.cut(features["maintainer_latency"], bins=[0, 24, 7 * 24, np.inf], labels=labels)
+    model = catboost.CatBoostClassifier(objective="MultiClassOneVsAll", random_state=1, silent=True).fit(X, y)
+    model = sklearn.frozen.FrozenEstimator(model)
+    return sklearn.calibration.CalibratedClassifierCV(model, method="isotonic").fit(X, y)
+
+
+def export_model(model):
+    joblib.dump(model, get_path("model_maintainers"))
+
+
+def import_model():
+    return joblib.load(get_path("model_maintainers"))
+
+
+def create_state(project, bots=None, owners=None):
+    return {
+        "project": project,
+        "bots": set(bots if bots is not None else []),
+        "owners": set(owners if owners is not None else []),
+        "maintainers": {},
+        "pulls": {},
+        "features": {},
+        "commits": collections.Counter(),
+        "contributors": {},
+        "open_pulls": 0,
+        "events": [],
+        "actors": [collections.Counter(), collections.Counter()],
+        "responses": [],
+        "latencies": [],
+        "starts": [0, 0],
+    }
+
+
+def find_contributor(state, actor):
+    return state["contributors"].setdefault(actor, {"pulls": 0, "open_pulls": 0, "merged": 0, "latencies": []})
+
+
+def is_bot(state, event):
+    if (bot := event.get("is_bot")) is not None and pd.notna(bot):
+        return bool(bot)
+    actor = event["actor"]
+    return actor.endswith(("bot", "[bot]")) or actor in state["bots"] or actor in state["owners"]
+
+
+def is_maintainer(state, event):
+    if (maintainer := event.get("is_maintainer")) is not None and pd.notna(maintainer):
+        return bool(maintainer)
+    return event["time"] >= state["maintainers"].get(event["actor"], pd.Timestamp.max)
+
+
+def slide_state(state, time):
+    last = time - pd.DateOffset(months=3)
+    events, responses = state["events"], state["responses"]
+    start, responded = state["starts"]
+    while start < len(events) and events[start][0] < last:
+        _, actor, maintainer = events[start]
+        actors = state["actors"][maintainer]
+        actors[actor] -= 1
+        if not actors[actor]:
+            del actors[actor]
+        start += 1
+    while start > 0 and events[start - 1][0] >= last:
+        start -= 1
+        _, actor, maintainer = events[start]
+        state["actors"][maintainer][actor] += 1
+    while responded < len(responses) and responses[responded][0] < last:
+        del state["latencies"][bisect.bisect_left(state["latencies"], responses[responded][1])]
+        responded += 1
+    while responded > 0 and responses[responded - 1][0] >= last:
+        responded -= 1
+        bisect.insort(state["latencies"], responses[responded][1])
+    state["starts"] = [start, responded]
+
+
+def resolve_pull(state, pull, merged):
+    if pull["is_open"]:
+        pull["is_open"] = False
+        state["open_pulls"] -= 1
+        contributor = find_contributor(state, pull["contributor"])
+        contributor["open_pulls"] -= 1
+        if merged:
+            pull["is_merged"] = True
+            contributor["merged"] += 1
+
+
+def update_state(state, event):
+    if event["event"] == "resolved":
+        resolve_pull(state, state["pulls"][event["pull_number"]], merged=event["merged"])
+        return
+    actor, kind, time, pull_number = event["actor"], event["event"], event["time"], event["pull_number"]
+    if kind == "pulled":
+        state["pulls"][pull_number] = {
+            "contributor": actor,
+            "opened_at": time,
+            "is_open": True,
+            "is_merged": False,
+            "maintainer_responded_at": None,
+            "contributor_responded_at": None,
+        }
+        contributor = find_contributor(state, actor)
+        contributor["pulls"] += 1
+        contributor["open_pulls"] += 1
+        state["open_pulls"] += 1
+    pull = state["pulls"].get(pull_number)
+    is_contributor = pull is not None and actor == pull["contributor"]
+    if (
+        pull is not None
+        and actor != "ghost"
+        and (kind in ["merged", *maintainer_events] or (kind == "closed" and not is_contributor))
+    ):
+        state["maintainers"][actor] = min(time, state["maintainers"].get(actor, pd.Timestamp.max))
+    if not (bot := is_bot(state, event)):
+        maintainer = int(is_maintainer(state, event))
+        state["events"].append((time, actor, maintainer))
+        state["actors"][maintainer][actor] += 1
+    if pull is None:
+        if kind == "committed":
+            state["commits"][pull_number] += 1
+        return
+    if event.get("transitions", True):
+        if kind == "merged" or (kind == "closed" and pd.notna(event.get("commit_id"))):
+            resolve_pull(state, pull, merged=True)
+        elif kind == "closed":
+            resolve_pull(state, pull, merged=False)
+        elif kind == "reopened" and not pull["is_open"] and not pull["is_merged"]:
+            pull["is_open"] = True
+            state["open_pulls"] += 1
+            find_contributor(state, pull["contributor"])["open_pulls"] += 1
+    if (
+        pull["maintainer_responded_at"] is None
+        and not bot
+        and is_maintainer(state, event)
+        and not is_contributor
+        and kind in maintainer_responses
+        and time > pull["opened_at"]
+    ):
+        pull["maintainer_responded_at"] = time
+        latency = (time - pull["opened_at"]) / np.timedelta64(1, "h")
+        state["responses"].append((time, latency))
+        bisect.insort(state["latencies"], latency)
+    elif (
+        pull["maintainer_responded_at"] is not None
+        and pull["contributor_responded_at"] is None
+        and is_contributor
+        and kind in contributor_responses
+        and time > pull["maintainer_responded_at"]
+    ):
+        pull["contributor_responded_at"] = time
+        bisect.insort(
+            find_contributor(state, actor)["latencies"],
+            (time - pull["maintainer_responded_at"]) / np.timedelta64(1, "h"),
+        )
+
+
+def extract_features(state, event):
+    opened_at = event["time"]
+    slide_state(state, opened_at)
+    contributor = state["contributors"].get(event["actor"], {"pulls": 0, "open_pulls": 0, "merged": 0, "latencies": []})
+    title, body = event.get("title"), event.get("body")
+    return {
+        "pr_hour": opened_at.hour,
+        "pr_day": opened_at.isoweekday(),
+        "pr_description": (len(title.split()) if pd.notna(title) else 0) + (len(body.split()) if pd.notna(body) else 0),
+        "pr_commits": event["commits"],
+        "contributor_open_pulls": contributor["open_pulls"],
+        "contributor_acceptance_rate": contributor["merged"] / contributor["pulls"] if contributor["pulls"] else 0,
+        "contributor_median_latency": statistics.median(contributor["latencies"]) if contributor["latencies"] else 0,
+        "project_open_pulls": state["open_pulls"],
+        "project_maintainers": len(state["actors"][1]),
+        "project_community": len(state["actors"][0]),
+        "project_median_latency": statistics.median(state["latencies"]) if state["latencies"] else 0,
+    }
+
+
+def ingest_events(state, events):
+    features = {}
+    events = sorted((event for event in events if pd.notna(event["time"])), key=lambda event: event["time"])
+    for _, group in itertools.groupby(events, key=lambda event: event["time"]):
+        group = list(group)
+        commits = collections.Counter(
+            event["pull_number"]
+            for event in group
+            if event["event"] == "committed" and event["pull_number"] not in state["pulls"]
+        )
+        for event in group:
+            if event["event"] == "pulled":
+                pull_number = event["pull_number"]
+                features[pull_number] = state["features"][pull_number] = extract_features(
+                    state, {"commits": state["commits"][pull_number] + commits[pull_number], **event}
+                )
+        for event in group:
+            update_state(state, event)
+    return pd.DataFrame.from_dict(features, orient="index", columns=characteristics).rename_axis("pull_number")
+
+
+def import_state_events(project):
+    events = (
+        import_dataset(project, ["event", "actor", "time", "is_bot", "is_maintainer"])
+        .reset_index()
+        .join(import_pulls(project)[["title", "body"]], on="pull_number")
+        .assign(transitions=False)
+    )
+    pulled = import_dataset_pulls(project, ["is_open", "is_merged", "opened_at", "resolved_at"]).query("not is_open")
+    resolved = pd.DataFrame(
+        {
+            "pull_number": pulled.index,
+            "event": "resolved",
+            "time": pulled[["opened_at", "resolved_at"]].max(axis=1).to_numpy(),
+            "merged": pulled["is_merged"].to_numpy(bool),
+        }
+    )
+    events = [event for event in events.to_dict("records") + resolved.to_dict("records") if pd.notna(event["time"])]
+    return sorted(events, key=lambda event: event["time"])
+
+
+def load_state(project, bots=None, owners=None):
+    state = create_state(project, bots, owners)
+    ingest_events(state, import_state_events(project))
+    return state
+
+
+def score_pulls(model, features):
+    return pd.DataFrame(model.predict_proba(features[characteristics]), index=features.index, columns=model.classes_)
+
+
+def collect_features(state, open_pulls=False):
+    features = {
+        pull_number: features
+        for pull_number, features in state["features"].items()
+        if not open_pulls or state["pulls"][pull_number]["is_open"]
+    }
+    return pd.DataFrame.from_dict(features, orient="index", columns=characteristics).rename_axis("pull_number")
+
+
+def benchmark(model, features, repeats=1000):
+    latencies = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        score_pulls(model, features.iloc[[i % len(features)]])
+        latencies.append((time.perf_counter() - start) * 1000)
+    start = time.perf_counter()
+    score_pulls(model, features)
+    return {
+        "p50": np.percentile(latencies, 50),
+        "p99": np.percentile(latencies, 99),
+        "batch": (time.perf_counter() - start) * 1000,
+        "pulls": len(features),
+    }
+
+
+def serve(model, state, stream):
+    for line in stream:
+        if not line.strip():
+            continue
+        event = json.loads(line)
+        event["time"] = pd.Timestamp(event["time"]).tz_localize(None)
+        features = ingest_events(state, [event])
+        for pull_number, probabilities in score_pulls(model, features).iterrows():
+            print(json.dumps({"project": state["project"], "pull_number": pull_number, **probabilities}), flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--train", action="store_true", help="train and persist the calibrated model")
+    parser.add_argument("--project", help="load the state of the project from its dataset")
+    parser.add_argument("--events", help="ingest events from a JSONL file and score their pull requests")
+    parser.add_argument("--serve", action="store_true", help="score pull requests of JSONL events from stdin")
+    parser.add_argument("--benchmark", action="store_true", help="measure p50 and p99 scoring latency")
+    arguments = parser.parse_known_args()[0]
+    logger = get_logger(__file__)
+    if arguments.train:
+        logger.info("Training model")
+        export_model(
+            train_model(pd.concat([import_features_maintainers(project) for project in measured_maintainers()]))
+        )
+    if arguments.project is None:
+        return
+    model = import_model()
+    logger.info(f"{arguments.project}: Loading state")
+    state = load_state(
+        arguments.project, bots=import_bots().index, owners=[project.split("/")[0] for project in selected()]
+    )
+    if arguments.benchmark:
+        logger.info(f"{arguments.project}: Benchmarking {benchmark(model, collect_features(state))}")
+    if arguments.events is not None:
+        events = import_events(arguments.events)
+        events["time"] = pd.to_datetime(events["time"]).dt.tz_localize(None)
+        score_pulls(model, ingest_events(state, events.to_dict("records"))).to_csv(sys.stdout)
+    if arguments.serve:
+        serve(model, state, sys.stdin)
+    elif arguments.events is None:
+        score_pulls(model, collect_features(state, open_pulls=True)).to_csv(sys.stdout)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("Stop predicting latency")
+        exit(1)
@@ -1,201 +1,162 @@
 import csv
+import functools
 import re
 
-import joblib
 import pandas as pd
 
+from archives import open_archive, read_diff
 from common import (
+    check_files,
     cleanup_files,
+    compile_keys,
     force_refresh,
     get_logger,
     get_path,
     initialize,
-    lookup_keys,
     open_commits,
+    open_commits_store,
     open_patches_raw,
+    open_patches_store,
     open_pulls_raw,
-    open_timelines_fixed,
     open_timelines_raw,
+    split_patch,
     toanalyze,
 )
+from scheduling import schedule
 
 initialize()
 
 
-def fix_committed(timeline, commits):
-    events = []
-    for event in timeline:
-        if event["event"] == "committed":
-            event["author"]["login"] = lookup_keys("author.login", commits[event["sha"]])
-        events.append(event)
-    return events
+lookup_author = compile_keys("author.login")
+lookup_actor = compile_keys(("actor.login", "user.login", "author.login"))
+lookup_time = compile_keys(("created_at", "committer.date", "submitted_at"))
+lookup_columns = {
+    column: compile_keys(column)
+    for column in ["pull_number", "event_number", "event", "actor", "time", "state", "commit_id", "referenced", "sha"]
+}
+lookup_pull_columns = {column: compile_keys(column) for column in ["number", "html_url", "title", "body"]}
 
 
-def fix_referenced(timeline):
-    events = []
+def fix_timeline(timeline, pull, commits, columns):
+    events = [{"event": "pulled", **pull}]
     for event in timeline:
-        if event["event"] == "referenced":
+        if event["event"] == "committed":
+            event["author"]["login"] = lookup_author(commits[event["sha"]])
+        elif event["event"] == "referenced":
             event["referenced"] = event["url"].split("/")[4:6] == event["commit_url"].split("/")[4:6]
-        events.append(event)
-    return events
-
-
-def unpack_line_and_commit_commented(timeline):
-    events = []
-    for event in timeline:
         if event["event"] in ["line-commented", "commit-commented"]:
-            for comment in event["comments"]:
-                events.append({"event": event["event"], **comment})
+            events.extend({"event": event["event"], **comment} for comment in event["comments"])
         else:
             events.append(event)
-    return events
-
-
-def insert_pulled(timeline, pull):
-    return [{"event": "pulled", **pull}, *timeline]
-
-
-def identify_actor(timeline):
-    events = []
-    for event in timeline:
-        actor = lookup_keys(["actor.login", "user.login", "author.login"], event)
+    for event in events:
+        actor = lookup_actor(event)
         event["actor"] = actor.lower() if actor is not None else "ghost"
-        events.append(event)
-    return events
-
-
-def identify_time(timeline):
-    events = []
-    for event in timeline:
-        event["time"] = lookup_keys(["created_at", "committer.date", "submitted_at"], event)
-        events.append(event)
-    return events
-
-
-def add_pull_and_event_number(timeline):
-    events = []
-    pull_number = timeline[0]["number"]
-    for event_number, event in enumerate(sorted(timeline, key=lambda event: event["time"])):
-        event["pull_number"] = pull_number
+        event["time"] = lookup_time(event)
+    events.sort(key=lambda event: event["time"])
+    for event_number, event in enumerate(events):
+        event["pull_number"] = pull["number"]
         event["event_number"] = event_number
-        events.append(event)
-    return events
-
+        for column, lookup in lookup_columns.items():
+            columns[column].append(lookup(event))
 
-def fix_timeline(timeline, pull, commits):
-    timeline = fix_committed(timeline, commits)
-    timeline = fix_referenced(timeline)
-    timeline = unpack_line_and_commit_commented(timeline)
-    timeline = insert_pulled(timeline, pull)
-    timeline = identify_actor(timeline)
-    timeline = identify_time(timeline)
-    timeline = add_pull_and_event_number(timeline)
-    return timeline
 
+def resolve_commits(commits, store):
+    if isinstance(commits, dict):
+        return commits
+    return {sha: store[sha] for sha in commits}
 
-def fix_timelines(project, timelines, pulls, commits):
-    fixed = open_timelines_fixed(project)
-    for pull in pulls:
-        fixed[pull] = fix_timeline(timelines[pull], pulls[pull], commits[pull])
-    return fixed
 
-
-def filter_timelines(timelines):
-    rows = []
-    for timeline in timelines.values():
-        for event in timeline:
-            row = {}
-            for column in [
-                "pull_number",
-                "event_number",
-                "event",
-                "actor",
-                "time",
-                "state",
-                "commit_id",
-                "referenced",
-                "sha",
-            ]:
-                row[column] = lookup_keys(column, event)
-            rows.append(row)
-    return rows
+def filter_timelines(timelines, pulls, commits, store):
+    columns = {column: [] for column in lookup_columns}
+    for pull_number, pull in pulls.items():
+        fix_timeline(timelines[pull_number], pull, resolve_commits(commits[pull_number], store), columns)
+    return pd.DataFrame(columns).sort_values(["pull_number", "event_number"])
 
 
 def filter_pulls(pulls):
     rows = []
     for pull in pulls.values():
-        row = {}
-        for column in ["number", "html_url", "title", "body"]:
-            row[column] = lookup_keys(column, pull)
-        rows.append(row)
-    return rows
+        rows.append({column: lookup(pull) for column, lookup in lookup_pull_columns.items()})
+    return pd.DataFrame(rows).sort_values("number")
+
+
+diffstat_patterns = {
+    "added_lines": r"(?m)^ .+?(\d+) insertions?\(\+\)",
+    "deleted_lines": r"(?m)^ .+?(\d+) deletions?\(\-\)",
+    "changed_files": r"(?m)^ (\d+) files? changed,",
+}
+
 
+def parse_diffstat(diff):
+    diffstat = {}
+    for column, pattern in diffstat_patterns.items():
+        match = re.search(pattern if isinstance(diff, str) else pattern.encode(), diff)
+        diffstat[column] = int(match.group(1)) if match else 0
+    return diffstat
 
-def filter_patches(patches):
+
+def filter_patches(patches, read):
+    diffstats = {}
     changes = []
     for pull_number, patch in patches.items():
-        for diff in re.findall(
-            (
-                r"(?ms)^From \S+ Mon Sep 17 00:00:00 2001$.+?^---$.+?(?=^From \S+ Mon Sep 17 00:00:00 2001$.+?^---$)"
-                r"|^From \S+ Mon Sep 17 00:00:00 2001$.+?^---$.+"
-            ),
-            patch,
-        ):
-            added_lines = re.search(r"(?m)^ .+?(\d+) insertions?\(\+\)", diff)
-            deleted_lines = re.search(r"(?m)^ .+?(\d+) deletions?\(\-\)", diff)
-            changed_files = re.search(r"(?m)^ (\d+) files? changed,", diff)
-            changes.append(
-                {
-                    "pull_number": int(pull_number),
-                    "sha": re.match(r"(?ms)^From (\S+) Mon Sep 17 00:00:00 2001$.+?^---$", diff).group(1),
-                    "added_lines": added_lines.group(1) if added_lines else 0,
-                    "deleted_lines": deleted_lines.group(1) if deleted_lines else 0,
-                    "changed_files": changed_files.group(1) if changed_files else 0,
-                }
-            )
-    return changes
+        diffs = split_patch(patch) if isinstance(patch, str) else [(sha, None) for sha in patch]
+        for sha, diff in diffs:
+            if sha not in diffstats:
+                diffstats[sha] = parse_diffstat(diff if diff is not None else read(sha))
+            changes.append({"pull_number": int(pull_number), "sha": sha, **diffstats[sha]})
+    return pd.DataFrame(
+        changes, columns=["pull_number", "sha", "added_lines", "deleted_lines", "changed_files"]
+    ).sort_values(["pull_number", "sha"])
 
 
 def export_timelines(project, timelines):
-    pd.DataFrame(timelines).sort_values(["pull_number", "event_number"]).to_csv(
-        get_path("timelines", project), index=False
-    )
+    timelines.to_csv(get_path("timelines", project), index=False)
 
 
 def export_pulls(project, pulls):
-    pd.DataFrame(pulls).sort_values("number").to_csv(
-        get_path("pulls", project), index=False, quoting=csv.QUOTE_ALL, escapechar="\\"
-    )
+    pulls.to_csv(get_path("pulls", project), index=False, quoting=csv.QUOTE_ALL, escapechar="\\")
 
 
 def export_patches(project, patches):
-    pd.DataFrame(patches).sort_values(["pull_number", "sha"]).to_csv(get_path("patches", project), index=False)
+    patches.to_csv(get_path("patches", project), index=False)
 
 
-def preprocess_data(project):
-    logger = get_logger(__file__, modules={"sqlitedict": "WARNING"})
-    logger.info(f"{project}: Preprocessing data")
+def filter_data(project):
     timelines = open_timelines_raw(project)
     pulls = open_pulls_raw(project)
     commits = open_commits(project)
-    patches = open_patches_raw(project)
-    timelines = fix_timelines(project, timelines, pulls, commits)
-    export_timelines(project, filter_timelines(timelines))
-    export_pulls(project, filter_pulls(pulls))
-    export_patches(project, filter_patches(patches))
-    timelines.terminate()
+    commits_store = open_commits_store(project) if get_path("commits_store", project).exists() else {}
+    if check_files(["patches_archive", "patches_index"], project):
+        archive = open_archive(project)
+        patches, read = archive["pulls"], functools.partial(read_diff, archive)
+    else:
+        patches = open_patches_raw(project)
+        read = open_patches_store(project).__getitem__ if get_path("patches_store", project).exists() else None
+    return (
+        filter_timelines(timelines, pulls, commits, commits_store),
+        filter_pulls(pulls),
+        filter_patches(patches, read),
+    )
+
+
+def preprocess_data(project):
+    logger = get_logger(__file__, modules={"sqlitedict": "WARNING"})
+    logger.info(f"{project}: Preprocessing data")
+    timelines, pulls, patches = filter_data(project)
+    export_timelines(project, timelines)
+    export_pulls(project, pulls)
+    export_patches(project, patches)
 
 
 def main():
     projects = []
     for project in toanalyze():
-        if cleanup_files(["timelines_fixed", "timelines", "pulls", "patches"], force_refresh(), project):
+        if cleanup_files(["timelines", "pulls", "patches"], force_refresh(), project):
             projects.append(project)
         else:
             print(f"Skip preprocessing data for project {project}")
     if projects:
-        with joblib.Parallel(n_jobs=-1, verbose=50) as parallel:
-            parallel(joblib.delayed(preprocess_data)(project) for project in projects)
+        schedule(preprocess_data, projects)
 
 
 if __name__ == "__main__":
@@ -1,24 +1,64 @@
-import joblib
+import argparse
+import json
+import pickle
+
 import numpy as np
 import pandas as pd
 
 from common import (
+    apply_schema,
+    check_files,
     cleanup_files,
-    convert_dtypes,
+    count_months,
+    dataset_pulls_columns,
     force_refresh,
     get_logger,
     get_path,
     import_bots,
+    import_dataset,
+    import_patches,
+    import_pulls,
     import_timelines,
     initialize,
+    open_changes,
+    open_metadata,
     preprocessed,
     selected,
 )
+from cubes import build_cube, export_cube
+from preprocess_data import export_patches, export_pulls, export_timelines
+from scheduling import schedule
 
 initialize()
 
+maintainer_events = [
+    "added_to_project",
+    "converted_note_to_issue",
+    "deployed",
+    "deployment_environment_changed",
+    "locked",
+    "moved_columns_in_project",
+    "pinned",
+    "removed_from_project",
+    "review_dismissed",
+    "transferred",
+    "unlocked",
+    "unpinned",
+    "user_blocked",
+]
+maintainer_responses = ["commented", "reviewed", "line-commented", "commit-commented", "merged", "closed", "reopened"]
+contributor_responses = [
+    "committed",
+    "head_ref_force_pushed",
+    "commented",
+    "reviewed",
+    "line-commented",
+    "commit-commented",
+    "closed",
+    "reopened",
+]
+
 
-@convert_dtypes
 def add_status(timelines):
     def find_status(timeline):
         pulled = timeline.query("event == 'pulled'")
@@ -61,7 +101,6 @@ def add_status(timelines):
     return timelines.drop(columns=["state", "commit_id", "referenced"])
 
 
-@convert_dtypes
 def add_contributor(timelines):
     def find_contributor(timeline):
         timeline["is_contributor"] = timeline["actor"] == timeline.query("event == 'pulled'")["actor"].iat[0]
@@ -70,7 +109,6 @@ def add_contributor(timelines):
     return timelines.groupby("pull_number", group_keys=False).apply(find_contributor)
 
 
-@convert_dtypes
 def add_maintainer(timelines):
     def find_maintainer(events):
         events = events.assign(is_maintainer=False)
@@ -82,12 +120,9 @@ def add_maintainer(timelines):
                         events.query("(merged_by == @actor) or (closed_by == @actor and not is_contributor)")[
                             "resolved_at"
                         ],
-                        events.query(
-                            "event.isin(['added_to_project', 'converted_note_to_issue', 'deployed',"
-                            " 'deployment_environment_changed', 'locked', 'moved_columns_in_project', 'pinned',"
-                            " 'removed_from_project', 'review_dismissed', 'transferred', 'unlocked', 'unpinned',"
-                            " 'user_blocked']) or (event == 'closed' and not is_contributor)"
-                        )["time"],
+                        events.query("event.isin(@maintainer_events) or (event == 'closed' and not is_contributor)")[
+                            "time"
+                        ],
                     ]
                 ).min(),
                 "is_maintainer",
@@ -97,7 +132,26 @@ def add_maintainer(timelines):
     return timelines.groupby("actor", group_keys=False, observed=True).apply(find_maintainer)
 
 
-@convert_dtypes
+def find_candidates(timelines):
+    actor = timelines["actor"].astype(object)
+    resolved = timelines.loc[
+        (actor == timelines["merged_by"].astype(object))
+        | ((actor == timelines["closed_by"].astype(object)) & ~timelines["is_contributor"]),
+        ["actor", "resolved_at"],
+    ].rename(columns={"resolved_at": "time"})
+    events = timelines.loc[
+        timelines["event"].isin(maintainer_events) | ((timelines["event"] == "closed") & ~timelines["is_contributor"]),
+        ["actor", "time"],
+    ]
+    candidates = pd.concat([resolved, events]).astype({"actor": object}).query("actor != 'ghost' and time.notna()")
+    return candidates.groupby(["actor", "pull_number"])["time"].min()
+
+
+def set_maintainer(timelines, thresholds):
+    timelines["is_maintainer"] = (timelines["time"] >= timelines["actor"].astype(object).map(thresholds)).to_numpy()
+    return timelines
+
+
 def add_bot(timelines, bots, owners):
     timelines["is_bot"] = (
         timelines["actor"].str.endswith(("bot", "[bot]"))
@@ -107,21 +161,18 @@ def add_bot(timelines, bots, owners):
     return timelines
 
 
-@convert_dtypes
 def add_maintainer_response(timelines):
     timelines = timelines.assign(is_maintainer_response=False)
     timelines.loc[
         timelines.query(
-            "is_maintainer and not is_bot and not is_contributor and (event.isin(['commented', 'reviewed',"
-            " 'line-commented', 'commit-commented', 'merged', 'closed', 'reopened']) or (event == 'referenced' and time"
-            " == merged_at)) and time > opened_at"
+            "is_maintainer and not is_bot and not is_contributor and (event.isin(@maintainer_responses) or (event =="
+            " 'referenced' and time == merged_at)) and time > opened_at"
         ).index,
         "is_maintainer_response",
     ] = True
     return timelines
 
 
-@convert_dtypes
 def add_maintainer_latency(timelines):
     def find_maintainer_latency(timeline):
         timeline = timeline.assign(
@@ -142,20 +193,17 @@ def add_maintainer_latency(timelines):
     return timelines.groupby("pull_number", group_keys=False).apply(find_maintainer_latency)
 
 
-@convert_dtypes
 def add_contributor_response(timelines):
     timelines = timelines.assign(is_contributor_response=False)
     timelines.loc[
         timelines.query(
-            "is_contributor and event.isin(['committed', 'head_ref_force_pushed', 'commented', 'reviewed',"
-            " 'line-commented', 'commit-commented', 'closed', 'reopened']) and time > maintainer_responded_at"
+            "is_contributor and event.isin(@contributor_responses) and time > maintainer_responded_at"
         ).index,
         "is_contributor_response",
     ] = True
     return timelines
 
 
-@convert_dtypes
 def add_contributor_latency(timelines):
     def find_contributor_latency(timeline):
         timeline = timeline.assign(
@@ -172,14 +220,45 @@ def add_contributor_latency(timelines):
     return timelines.groupby("pull_number", group_keys=False).apply(find_contributor_latency)
 
 
+def measure_statistics(project, dataset):
+    metadata = open_metadata(project)
+    pulled = dataset.query("event == 'pulled'")
+    return {
+        "project": project,
+        "language": metadata["language"],
+        "stars": metadata["watchers"],
+        "age": count_months(pd.Timestamp(metadata["created_at"]).tz_localize(None), pulled["time"].max()),
+        "contributors": pulled["actor"].nunique(),
+        "maintainers": dataset.query("is_maintainer")["actor"].nunique(),
+        "bots": dataset.query("is_bot")["actor"].nunique(),
+        "bot contributors": pulled.query("is_bot")["actor"].nunique(),
+        "bot maintainers": dataset.query("is_bot and is_maintainer")["actor"].nunique(),
+        "pulls": len(pulled),
+        "open": len(pulled.query("is_open")),
+        "closed": len(pulled.query("is_closed")),
+        "merged": len(pulled.query("is_merged")),
+        "maintainer responded": len(pulled.query("maintainer_latency.notna()")),
+        "contributor responded": len(pulled.query("contributor_latency.notna()")),
+    }
+
+
 def export_dataset(project, timelines):
-    timelines.to_csv(get_path("dataset", project))
+    timelines = timelines.sort_index()
+    timelines.drop(columns=dataset_pulls_columns).to_parquet(
+        get_path("dataset_events", project), row_group_size=100_000
+    )
+    timelines.query("event == 'pulled'").droplevel("event_number")[dataset_pulls_columns].to_parquet(
+        get_path("dataset_pulls", project), row_group_size=10_000
+    )
 
 
-def process_data(project, bots, owners):
-    logger = get_logger(__file__)
-    logger.info(f"{project}: Processing data")
-    timelines = import_timelines(project)
+def export_summary(project, summary):
+    with open(get_path("summary", project), "w") as file:
+        json.dump(summary, file, ensure_ascii=False, indent=4)
+
+
+@apply_schema("dataset")
+def process_timelines(timelines, bots, owners):
     timelines = add_status(timelines)
     timelines = add_contributor(timelines)
     timelines = add_maintainer(timelines)
@@ -188,24 +267,172 @@ def process_data(project, bots, owners):
     timelines = add_maintainer_latency(timelines)
     timelines = add_contributor_response(timelines)
     timelines = add_contributor_latency(timelines)
-    export_dataset(project, timelines)
+    return timelines
+
+
+@apply_schema("dataset")
+def process_pulls(timelines, thresholds, bots, owners):
+    timelines = set_maintainer(timelines, thresholds)
+    timelines = add_bot(timelines, bots, owners)
+    timelines = add_maintainer_response(timelines)
+    timelines = add_maintainer_latency(timelines)
+    timelines = add_contributor_response(timelines)
+    timelines = add_contributor_latency(timelines)
+    return timelines
+
+
+@apply_schema("dataset")
+def merge_dataset(dataset, processed, stale):
+    dataset = dataset[~dataset.index.get_level_values("pull_number").isin(stale)]
+    if processed:
+        dataset = pd.concat([dataset, *[pulls[dataset.columns] for pulls in processed]])
+    return dataset.sort_index()
+
+
+def fingerprint_timelines(timelines):
+    return pd.util.hash_pandas_object(timelines).groupby(level="pull_number").sum().to_dict()
+
+
+def create_state(dataset, timelines, bots, owners):
+    return {
+        "bots": sorted(bots),
+        "owners": sorted(owners),
+        "fingerprints": fingerprint_timelines(timelines),
+        "candidates": find_candidates(dataset),
+    }
+
+
+def update_dataset(project, dataset, state, timelines, bots, owners):
+    logger = get_logger(__file__)
+    if dataset is None or state is None or (state["bots"], state["owners"]) != (sorted(bots), sorted(owners)):
+        dataset = process_timelines(timelines, bots, owners)
+        return dataset, create_state(dataset, timelines, bots, owners)
+    fingerprints = fingerprint_timelines(timelines)
+    changed = [
+        pull_number for pull_number, value in fingerprints.items() if state["fingerprints"].get(pull_number) != value
+    ]
+    removed = [pull_number for pull_number in state["fingerprints"] if pull_number not in fingerprints]
+    candidates = state["candidates"]
+    candidates = candidates[~candidates.index.get_level_values("pull_number").isin(changed + removed)]
+    processed = []
+    if changed:
+        processed.append(add_contributor(add_status(timelines.loc[changed])))
+        candidates = pd.concat([candidates, find_candidates(processed[0])]).sort_index()
+    previous = state["candidates"].groupby(level="actor").min()
+    thresholds = candidates.groupby(level="actor").min()
+    previous, current = previous.align(thresholds)
+    affected = current.index[(previous != current) & (previous.notna() | current.notna())]
+    unchanged = dataset.index.get_level_values("pull_number").isin(changed + removed)
+    if extra := sorted(
+        set(dataset[~unchanged & dataset["actor"].isin(affected)].index.get_level_values("pull_number"))
+    ):
+        processed.append(add_contributor(add_status(timelines.loc[extra])))
+    processed = [process_pulls(pulls, thresholds, bots, owners) for pulls in processed]
+    logger.info(
+        f"{project}: Reprocessed {len(changed)} new or changed and {len(extra)} affected pull requests,"
+        f" removed {len(removed)} pull requests"
+    )
+    dataset = merge_dataset(dataset, processed, changed + removed + extra)
+    return dataset, {**state, "fingerprints": fingerprints, "candidates": candidates}
+
+
+def replay_history(timelines, time):
+    opened = timelines.query("event == 'pulled' and time < @time").index.get_level_values("pull_number")
+    return timelines[timelines.index.get_level_values("pull_number").isin(opened) & (timelines["time"] < time)]
+
+
+def verify_incremental(project, bots, owners, steps=4):
+    logger = get_logger(__file__)
+    timelines = import_timelines(project)
+    times = timelines.query("event == 'pulled'")["time"].quantile([step / steps for step in range(1, steps)])
+    dataset = state = None
+    for time in [*times, timelines["time"].max() + pd.Timedelta(1, "ns")]:
+        history = replay_history(timelines, time)
+        dataset, state = update_dataset(project, dataset, state, history, bots, owners)
+        try:
+            pd.testing.assert_frame_equal(
+                dataset, process_timelines(history, bots, owners).sort_index(), check_categorical=False
+            )
+        except AssertionError as exception:
+            logger.error(f"{project}: Incremental processing until {time} differs from full rebuild: {exception}")
+            return False
+    logger.info(f"{project}: Incremental processing is equivalent to full rebuild in {steps} steps")
+    return True
+
+
+def import_process_state(project):
+    with open(get_path("process_state", project), "rb") as reader:
+        return pickle.load(reader)
+
+
+def export_process_state(project, state):
+    with open(get_path("process_state", project), "wb") as writer:
+        pickle.dump(state, writer, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def concat_columns(rows):
+    return pd.DataFrame({column: [value for row in rows for value in row[column]] for column in rows[0]})
+
+
+def merge_changes(project):
+    with open_changes(project) as changes:
+        if not (rows := list(changes.values())):
+            return
+    changed = [row["pulls"]["number"] for row in rows]
+    timelines = pd.read_csv(get_path("timelines", project), low_memory=False)
+    timelines = pd.concat(
+        [timelines[~timelines["pull_number"].isin(changed)], concat_columns([row["timelines"] for row in rows])]
+    )
+    export_timelines(project, timelines.sort_values(["pull_number", "event_number"]))
+    pulls = import_pulls(project).reset_index()
+    pulls = pd.concat([pulls[~pulls["number"].isin(changed)], pd.DataFrame([row["pulls"] for row in rows])])
+    export_pulls(project, pulls.sort_values("number"))
+    if patched := [row for row in rows if row["patches"] is not None]:
+        patches = import_patches(project).reset_index()
+        stale = patches["pull_number"].isin([row["pulls"]["number"] for row in patched])
+        patches = pd.concat([patches[~stale], concat_columns([row["patches"] for row in patched])])
+        export_patches(project, patches.sort_values(["pull_number", "sha"]))
+
+
+def process_data(project, bots, owners, incremental=False):
+    logger = get_logger(__file__)
+    logger.info(f"{project}: Processing data")
+    dataset = state = None
+    if incremental and check_files(["dataset_events", "dataset_pulls", "process_state"], project):
+        dataset, state = import_dataset(project), import_process_state(project)
+    if ingested := check_files("changes", project):
+        merge_changes(project)
+    timelines = import_timelines(project)
+    dataset, state = update_dataset(project, dataset, state, timelines, bots, owners)
+    export_dataset(project, dataset)
+    export_cube(project, build_cube(dataset))
+    export_summary(project, measure_statistics(project, dataset))
+    export_process_state(project, state)
+    if ingested:
+        with open_changes(project) as changes:
+            changes.clear()
 
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--incremental", action="store_true", help="process only new or changed pull requests")
+    parser.add_argument("--verify", action="store_true", help="compare incremental processing with full rebuild")
+    arguments = parser.parse_known_args()[0]
+    bots, owners = import_bots().index, [project.split("/")[0] for project in selected()]
+    if arguments.verify:
+        if not all(schedule(verify_incremental, preprocessed(), bots=bots, owners=owners)):
+            exit(1)
+        return
     projects = []
     for project in preprocessed():
-        if cleanup_files("dataset", force_refresh(), project):
+        if arguments.incremental or cleanup_files(
+            ["dataset_events", "dataset_pulls", "latency_cube", "summary", "process_state"], force_refresh(), project
+        ):
             projects.append(project)
         else:
             print(f"Skip processing data for project {project}")
     if projects:
-        with joblib.Parallel(n_jobs=-1, verbose=50) as parallel:
-            parallel(
-                joblib.delayed(process_data)(
-                    project, bots=import_bots().index, owners=[project.split("/")[0] for project in selected()]
-                )
-                for project in projects
-            )
+        schedule(process_data, projects, bots=bots, owners=owners, incremental=arguments.incremental)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,90 @@
+import argparse
+import collections
+import contextlib
+import functools
+import os
+import pathlib
+import sys
+import threading
+
+from common import get_path
+
+INTERVAL = 0.01
+
+
+def profiling_enabled():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profile", action="store_true", help="sample stacks of each project task")
+    return parser.parse_known_args()[0].profile or os.environ.get("PROFILE", "0") not in ["", "0"]
+
+
+def collapse_stack(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_qualname} ({pathlib.Path(code.co_filename).name}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def sample_stacks(threads, stacks, stop):
+    sampler = threading.get_ident()
+    while not stop.wait(INTERVAL):
+        for thread, frame in sys._current_frames().items():
+            if thread != sampler and (threads is None or thread in threads):
+                stacks[collapse_stack(frame)] += 1
+
+
+def get_profile_path(stage, project=None):
+    if project is None:
+        return get_path("profiles") / f"{stage}.folded"
+    return get_path("profiles") / stage / f"{project.replace('/', '_').lower()}.folded"
+
+
+def import_stacks(file):
+    stacks = collections.Counter()
+    with open(file) as reader:
+        for line in reader:
+            stack, count = line.rstrip("\n").rsplit(" ", 1)
+            stacks[stack] += int(count)
+    return stacks
+
+
+def export_stacks(file, stacks):
+    file.parent.mkdir(parents=True, exist_ok=True)
+    with open(file, "w") as writer:
+        writer.writelines(f"{stack} {count}\n" for stack, count in sorted(stacks.items()))
+
+
+@contextlib.contextmanager
+def profile_task(stage, project, all_threads=False):
+    stacks = collections.Counter()
+    stop = threading.Event()
+    threads = None if all_threads else {threading.get_ident()}
+    sampler = threading.Thread(target=sample_stacks, args=(threads, stacks, stop), daemon=True)
+    sampler.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        sampler.join()
+        export_stacks(get_profile_path(stage, project), stacks)
+
+
+def profiled(function, all_threads=False):
+    stage = pathlib.Path(function.__code__.co_filename).stem
+
+    @functools.wraps(function)
+    def wrapper(project, *args, **kwargs):
+        with profile_task(stage, project, all_threads):
+            return function(project, *args, **kwargs)
+
+    return wrapper
+
+
+def merge_profiles(stage, projects):
+    stacks = collections.Counter()
+    for project in projects:
+        if (file := get_profile_path(stage, project)).exists():
+            stacks.update(import_stacks(file))
+    export_stacks(get_profile_path(stage), stacks)
@@ -0,0 +1,127 @@
+import concurrent.futures
+import contextlib
+import csv
+import multiprocessing
+import os
+import pathlib
+import resource
+import time
+
+from common import check_files, get_logger, get_path, import_projects_fetched
+from profiler import merge_profiles, profile_task, profiling_enabled
+
+RATIO = 4
+BASE = 2**29
+PULL_BYTES = 2**16
+RATE = 2**-20
+
+
+def measure_size(project):
+    directory = get_path("directory", project)
+    if directory.exists() and (size := sum(file.stat().st_size for file in directory.iterdir() if file.is_file())):
+        return size
+    if check_files("projects_fetched", None):
+        projects = import_projects_fetched()
+        if project in projects.index:
+            return int(projects.at[project, "pulls"]) * PULL_BYTES
+    return 0
+
+
+def import_history(stage):
+    history = []
+    if get_path("schedule").exists():
+        with open(get_path("schedule"), newline="") as reader:
+            history = [
+                (int(record["size"]), int(record["peak"]), float(record["elapsed"]))
+                for record in csv.DictReader(reader)
+                if record["stage"] == stage
+            ]
+    return history
+
+
+def export_history(records):
+    exist = get_path("schedule").exists()
+    with open(get_path("schedule"), "a", newline="") as writer:
+        writer = csv.DictWriter(writer, fieldnames=["stage", "project", "size", "predicted", "peak", "elapsed"])
+        if not exist:
+            writer.writeheader()
+        writer.writerows(records)
+
+
+def predict_memory(history, size):
+    base = min([peak for _, peak, _ in history], default=BASE)
+    ratio = max([(peak - base) / size for size, peak, _ in history if size and peak > base], default=RATIO)
+    return base + round(ratio * size)
+
+
+def predict_time(history, size):
+    base = min([elapsed for _, _, elapsed in history], default=0)
+    rates = sorted((elapsed - base) / size for size, _, elapsed in history if size and elapsed > base)
+    rate = rates[len(rates) // 2] if rates else RATE
+    return base + rate * size
+
+
+def memory_budget():
+    if budget := os.environ.get("MEMORY_BUDGET"):
+        return round(float(budget) * 2**30)
+    return round(os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") * 0.8)
+
+
+def run_task(function, project, kwargs, stage=None):
+    start = time.monotonic()
+    with profile_task(stage, project) if stage is not None else contextlib.nullcontext():
+        result = function(project, **kwargs)
+    return result, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024, time.monotonic() - start
+
+
+def schedule(function, projects, n_jobs=None, **kwargs):
+    stage = pathlib.Path(function.__code__.co_filename).stem
+    logger = get_logger(__file__)
+    history = import_history(stage)
+    profile = profiling_enabled()
+    budget = memory_budget()
+    n_jobs = n_jobs or os.cpu_count()
+    sizes = {project: measure_size(project) for project in projects}
+    predicted = {project: predict_memory(history, sizes[project]) for project in projects}
+    expected = {project: predict_time(history, sizes[project]) for project in projects}
+    pending = sorted(projects, key=lambda project: expected[project], reverse=True)
+    running = {}
+    results = {}
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=n_jobs, mp_context=multiprocessing.get_context("forkserver"), max_tasks_per_child=1
+    ) as executor:
+        while pending or running:
+            available = budget - sum(predicted[project] for project in running.values())
+            while pending and len(running) < n_jobs:
+                if (project := next((project for project in pending if predicted[project] <= available), None)) is None:
+                    if running:
+                        break
+                    project = pending[0]
+                    logger.warning(f"{project}: Predicted memory exceeds budget of {budget / 2**30:.1f} GiB")
+                pending.remove(project)
+                available -= predicted[project]
+                running[executor.submit(run_task, function, project, kwargs, stage if profile else None)] = project
+            done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            records = []
+            for future in done:
+                project = running.pop(future)
+                results[project], peak, elapsed = future.result()
+                logger.info(
+                    f"{project}: Predicted {predicted[project] / 2**30:.2f} GiB, "
+                    f"peaked at {peak / 2**30:.2f} GiB in {elapsed:.1f}s (expected {expected[project]:.1f}s) "
+                    f"({len(results)}/{len(projects)})"
+                )
+                records.append(
+                    {
+                        "stage": stage,
+                        "project": project,
+                        "size": sizes[project],
+                        "predicted": predicted[project],
+                        "peak": peak,
+                        "elapsed": round(elapsed, 3),
+                    }
+                )
+            export_history(records)
+    if profile:
+        merge_profiles(stage, projects)
+    return [results[project] for project in projects]
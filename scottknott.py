@@ -0,0 +1,24 @@
+import functools
+
+import numpy as np
+import pandas as pd
+
+
+@functools.cache
+def import_scottknottesd():
+    import rpy2.robjects.packages
+    import rpy2.robjects.pandas2ri
+
+    rpy2.robjects.pandas2ri.activate()
+    return rpy2.robjects.packages.importr("ScottKnottESD")
+
+
+def rank_projects(data, alpha=0.05):
+    scottknottesd = import_scottknottesd()
+    rankings = {}
+    for project, x in data.groupby(level="project", sort=False):
+        skesd = scottknottesd.sk_esd(x.reset_index(drop=True), alpha=alpha, version="np")
+        rankings[project] = pd.Series(
+            np.asarray(skesd[1]).astype(int), index=[x.columns[i - 1] for i in np.asarray(skesd[3]).astype(int)]
+        )
+    return pd.DataFrame(rankings).T.astype(int)
@@ -0,0 +1,161 @@
+import argparse
+import bisect
+import collections
+import mmap
+import pickle
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from common import (
+    cleanup_files,
+    force_refresh,
+    get_logger,
+    get_path,
+    import_bots,
+    import_dataset_pulls,
+    initialize,
+    processed,
+    selected,
+)
+from predict_latency import create_state, import_state_events, ingest_events
+from scheduling import schedule
+
+initialize()
+REPLAY = 250
+
+
+def compact_state(state, time):
+    # Later slides never reach back further than three months and the days clamped at month ends
+    floor = time - pd.DateOffset(months=3, days=3)
+    start, responded = state["starts"]
+    start_cut = min(start, bisect.bisect_left(state["events"], floor, key=lambda event: event[0]))
+    responded_cut = min(responded, bisect.bisect_left(state["responses"], floor, key=lambda response: response[0]))
+    return {
+        **state,
+        "features": {},
+        "events": state["events"][start_cut:],
+        "responses": state["responses"][responded_cut:],
+        "starts": [start - start_cut, responded - responded_cut],
+    }
+
+
+def prune_state(state, events):
+    pulls = {event["pull_number"] for event in events}
+    actors = {event["actor"] for event in events if event.get("actor") is not None}
+    actors.update(pull["contributor"] for pull_number, pull in state["pulls"].items() if pull_number in pulls)
+    return {
+        **state,
+        "maintainers": {actor: time for actor, time in state["maintainers"].items() if actor in actors},
+        "pulls": {pull_number: pull for pull_number, pull in state["pulls"].items() if pull_number in pulls},
+        "commits": collections.Counter(
+            {pull_number: count for pull_number, count in state["commits"].items() if pull_number in pulls}
+        ),
+        "contributors": {actor: record for actor, record in state["contributors"].items() if actor in actors},
+    }
+
+
+def export_snapshot(writer, time, state, events):
+    # Keep only the pulls and actors the replay until the next snapshot touches, so closed pulls and inactive
+    # contributors are not copied into every snapshot
+    snapshot = {"state": prune_state(pickle.loads(state), events), "events": events}
+    block = zlib.compress(pickle.dumps(snapshot, protocol=pickle.HIGHEST_PROTOCOL))
+    offset = writer.tell()
+    writer.write(block)
+    return [time, offset, len(block), len(events)]
+
+
+def build_snapshots(project, bots, owners, freq="1D", replay=REPLAY):
+    logger = get_logger(__file__)
+    logger.info(f"{project}: Building snapshots")
+    state = create_state(project, bots, owners)
+    events = import_state_events(project)
+    times = pd.DatetimeIndex([event["time"] for event in events])
+    boundaries = [times[0].floor(freq), *(times.floor(freq) + pd.tseries.frequencies.to_offset(freq)).unique()]
+    rows = []
+    start = 0
+    pending = None
+    with open(get_path("snapshots", project), "wb") as writer:
+        for boundary in boundaries:
+            end = times.searchsorted(boundary, side="left")
+            ingest_events(state, events[start:end])
+            start = end
+            compacted = compact_state(state, boundary)
+            # Snapshot once the replay since the last one costs as much as loading the active window, or after at
+            # most replay events, so the archive grows linearly with the events and queries replay few of them
+            if pending is not None and end - pending[1] < min(len(compacted["events"]), replay):
+                continue
+            if pending is not None:
+                rows.append(export_snapshot(writer, pending[0], pending[2], events[pending[1] : end]))
+            pending = [boundary, end, pickle.dumps(compacted, protocol=pickle.HIGHEST_PROTOCOL)]
+        rows.append(export_snapshot(writer, pending[0], pending[2], events[pending[1] :]))
+    pd.DataFrame(rows, columns=["time", "offset", "length", "events"]).to_parquet(
+        get_path("snapshots_index", project), index=False
+    )
+    logger.info(f"{project}: Stored {len(rows)} snapshots in {rows[-1][1] + rows[-1][2]} bytes")
+
+
+def open_snapshots(project):
+    with open(get_path("snapshots", project), "rb") as reader:
+        buffer = mmap.mmap(reader.fileno(), 0, access=mmap.ACCESS_READ)
+    index = pd.read_parquet(get_path("snapshots_index", project))
+    return {
+        "buffer": memoryview(buffer),
+        "times": index["time"].to_numpy("datetime64[ns]"),
+        "blocks": index[["offset", "length"]].to_numpy(),
+        "pulled": import_dataset_pulls(project, ["opened_at"])["opened_at"],
+    }
+
+
+def read_snapshot(snapshots, time):
+    snapshot = max(int(np.searchsorted(snapshots["times"], np.datetime64(time, "ns"), side="right")) - 1, 0)
+    offset, length = snapshots["blocks"][snapshot]
+    snapshot = pickle.loads(zlib.decompress(snapshots["buffer"][offset : offset + length]))
+    return snapshot["state"], snapshot["events"]
+
+
+def query_state(snapshots, time):
+    time = pd.Timestamp(time)
+    state, events = read_snapshot(snapshots, time)
+    ingest_events(state, events[: bisect.bisect_left(events, time, key=lambda event: event["time"])])
+    return state
+
+
+def query_features(snapshots, pull_number):
+    time = snapshots["pulled"][pull_number]
+    state, events = read_snapshot(snapshots, time)
+    start = bisect.bisect_left(events, time, key=lambda event: event["time"])
+    end = bisect.bisect_right(events, time, key=lambda event: event["time"])
+    ingest_events(state, events[:start])
+    return ingest_events(state, events[start:end]).loc[pull_number]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--freq", default="1D", help="interval at which snapshots may be taken, such as 6h or 1D")
+    parser.add_argument("--replay", type=int, default=REPLAY, help="maximum number of events replayed by a query")
+    arguments = parser.parse_known_args()[0]
+    projects = []
+    for project in processed():
+        if cleanup_files(["snapshots", "snapshots_index"], force_refresh(), project):
+            projects.append(project)
+        else:
+            print(f"Skip building snapshots for project {project}")
+    if projects:
+        schedule(
+            build_snapshots,
+            projects,
+            bots=import_bots().index,
+            owners=[project.split("/")[0] for project in selected()],
+            freq=arguments.freq,
+            replay=arguments.replay,
+        )
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("Stop building snapshots")
+        exit(1)
@@ -0,0 +1,187 @@
+import pathlib
+import random
+import shutil
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(pathlib.Path(__file__).parents[1]))
+
+from common import get_path, import_bots, open_database
+
+PROJECTS = {"acme/widget": 160, "acme/gadget": 60}
+USERS = [f"user{i}" for i in range(30)]
+MAINTAINERS = ["alice", "bob", "carol"]
+BOTS = ["ci-bot", "dependabot[bot]", "helper"]
+EVENTS = [
+    "commented",
+    "reviewed",
+    "line-commented",
+    "labeled",
+    "locked",
+    "added_to_project",
+    "head_ref_force_pushed",
+    "commit-commented",
+]
+
+
+def format_time(time):
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def generate_patch(sha, author, rng):
+    added, deleted, files = rng.randint(0, 50), rng.randint(0, 20), rng.randint(1, 5)
+    diffstat = f" {files} file{'s' if files > 1 else ''} changed"
+    if added:
+        diffstat += f", {added} insertion{'s' if added > 1 else ''}(+)"
+    if deleted:
+        diffstat += f", {deleted} deletion{'s' if deleted > 1 else ''}(-)"
+    return (
+        f"From {sha} Mon Sep 17 00:00:00 2001\nFrom: {author}\nSubject: [PATCH] Change\n\n---\n a.py | 3 ++-\n"
+        f"{diffstat}\n\ndiff --git a/a.py b/a.py\n+x\n"
+    )
+
+
+def generate_events(author, opened, rng):
+    events, commits, patch = [], {}, ""
+    for _ in range(rng.randint(0, 4)):
+        sha = f"{rng.getrandbits(160):040x}"
+        login = author if rng.random() > 0.05 else None
+        commits[sha] = {"sha": sha, "author": {"login": login} if login else None}
+        committed_at = opened + pd.Timedelta(hours=rng.randint(-48, 200))
+        events.append(
+            {
+                "event": "committed",
+                "sha": sha,
+                "author": {"name": author},
+                "committer": {"date": format_time(committed_at)},
+            }
+        )
+        patch += generate_patch(sha, author, rng)
+    time = opened
+    for _ in range(rng.randint(0, 6)):
+        time += pd.Timedelta(hours=rng.expovariate(1 / 30))
+        event = rng.choice(EVENTS)
+        actor = {"login": login} if (login := rng.choice(USERS + MAINTAINERS * 2 + BOTS + [author, None])) else None
+        if event == "reviewed":
+            events.append({"event": event, "user": actor, "submitted_at": format_time(time), "state": "approved"})
+        elif event in ["line-commented", "commit-commented"]:
+            replied_at = time + pd.Timedelta(hours=1)
+            events.append(
+                {
+                    "event": event,
+                    "comments": [
+                        {"user": actor, "created_at": format_time(time)},
+                        {"user": {"login": author}, "created_at": format_time(replied_at)},
+                    ],
+                }
+            )
+        else:
+            events.append({"event": event, "actor": actor, "created_at": format_time(time)})
+    return events, commits, patch, time
+
+
+def close_events(project, number, author, time, rng):
+    closer = {"login": rng.choice(MAINTAINERS + [author, "user3"])}
+    sha = f"{rng.getrandbits(160):040x}"
+    closed = {"event": "closed", "actor": closer, "created_at": format_time(time), "commit_id": None}
+    if (resolution := rng.choice(["merged", "merged", "commit", "referenced", "closed"])) == "merged":
+        return [{"event": "merged", "actor": closer, "created_at": format_time(time), "commit_id": sha}, closed]
+    elif resolution == "commit":
+        return [{**closed, "commit_id": sha}]
+    elif resolution == "referenced":
+        repository = project if rng.random() < 0.7 else "other/project"
+        referenced = {
+            "event": "referenced",
+            "actor": closer,
+            "created_at": format_time(time),
+            "commit_id": sha,
+            "commit_url": f"https://api.github.com/repos/{repository}/commits/{sha}",
+            "url": f"https://api.github.com/repos/{project}/issues/events/{number}",
+        }
+        return [referenced, closed]
+    elif rng.random() < 0.3:
+        reopened_at, closed_at = time + pd.Timedelta(hours=2), time + pd.Timedelta(hours=5)
+        reopened = {"event": "reopened", "actor": {"login": author}, "created_at": format_time(reopened_at)}
+        return [closed, reopened, {**closed, "created_at": format_time(closed_at)}]
+    return [closed]
+
+
+def generate_project(project, size, rng):
+    get_path("directory", project).mkdir(parents=True, exist_ok=True)
+    files = ["pulls_raw", "timelines_raw", "commits", "patches_raw", "metadata"]
+    stores = {file: open_database(get_path(file, project)) for file in files}
+    for number in range(1, size + 1):
+        opened = pd.Timestamp(2019, 1, 1) + pd.Timedelta(hours=number * 20 + rng.randint(-30, 30))
+        author = rng.choice(USERS + MAINTAINERS + ["helper", "dependabot[bot]"])
+        state = rng.choice(["closed"] * 5 + ["open"])
+        events, commits, patch, time = generate_events(author, opened, rng)
+        if state == "closed":
+            events += close_events(project, number, author, time + pd.Timedelta(hours=rng.expovariate(1 / 50)), rng)
+        stores["pulls_raw"][number] = {
+            "number": number,
+            "html_url": f"https://github.com/{project}/pull/{number}",
+            "title": rng.choice(["Fix bug", "Add feature, again", None, 'Refactor "quoted" thing']),
+            "body": rng.choice([None, "", "Some body\nwith lines", "a, b, c"]),
+            "state": state,
+            "user": {"login": author.capitalize()},
+            "created_at": format_time(opened),
+        }
+        stores["timelines_raw"][number] = events
+        stores["commits"][number] = commits
+        stores["patches_raw"][number] = patch
+    stores["metadata"].update({"language": "Python", "watchers": 20000, "created_at": "2018-06-01T00:00:00Z"})
+    for store in stores.values():
+        store.close()
+
+
+@pytest.fixture(scope="session")
+def collection(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("collection")
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.chdir(directory)
+        rng = random.Random(7)
+        pd.DataFrame({"project": list(PROJECTS), "pulls": list(PROJECTS.values())}).to_csv(
+            get_path("projects_fetched"), index=False
+        )
+        pd.DataFrame({"project": list(PROJECTS)}).to_csv(get_path("projects"), index=False)
+        pd.DataFrame({"bot": ["helper"]}).to_csv(get_path("bots"), index=False)
+        for project, size in PROJECTS.items():
+            generate_project(project, size, rng)
+    return directory
+
+
+@pytest.fixture(scope="session")
+def processing(collection):
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.chdir(collection)
+        return {"bots": import_bots().index, "owners": [project.split("/")[0] for project in PROJECTS]}
+
+
+@pytest.fixture(scope="session")
+def processed(collection, processing, tmp_path_factory):
+    from preprocess_data import preprocess_data
+    from process_data import process_data
+
+    directory = tmp_path_factory.mktemp("processed")
+    shutil.copytree(collection, directory, dirs_exist_ok=True)
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.chdir(directory)
+        for project in PROJECTS:
+            preprocess_data(project)
+            process_data(project, **processing)
+    return directory
+
+
+@pytest.fixture
+def collected(collection, tmp_path, monkeypatch):
+    shutil.copytree(collection, tmp_path, dirs_exist_ok=True)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def data(processed, monkeypatch):
+    monkeypatch.chdir(processed)
+    return processed
@@ -0,0 +1,31 @@
+import pytest
+from conftest import PROJECTS
+
+from archives import archive_patches, import_archive_index, open_archive, read_patch
+from collect_data import deduplicate_data
+from common import get_path, open_patches_raw, split_patch
+from preprocess_data import preprocess_data
+
+
+@pytest.mark.parametrize("deduplicate", [False, True])
+@pytest.mark.parametrize("compress", [False, True])
+def test_archive_matches_patches(collected, compress, deduplicate):
+    expected = {}
+    for project in PROJECTS:
+        preprocess_data(project)
+        expected[project] = get_path("patches", project).read_bytes()
+        with open_patches_raw(project) as patches:
+            diffs = {int(pull_number): split_patch(patch) for pull_number, patch in patches.items()}
+        if deduplicate:
+            deduplicate_data(project)
+        archive_patches(project, compress=compress)
+        index = import_archive_index(project)
+        archive_patches(project, compress=compress)
+        assert import_archive_index(project).equals(index)
+        assert index["compressed"].eq(compress).all()
+        archive = open_archive(project)
+        for pull_number, patch in diffs.items():
+            assert [(sha, bytes(diff).decode()) for sha, diff in read_patch(archive, pull_number)] == patch
+        get_path("patches", project).unlink()
+        preprocess_data(project)
+        assert get_path("patches", project).read_bytes() == expected[project]
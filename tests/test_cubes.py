@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pytest
+from conftest import PROJECTS
+
+from common import import_dataset
+from cubes import ACCURACY, MINIMUM, import_cube, query_percentiles
+
+QUANTILES = (0.1, 0.5, 0.9, 0.99)
+
+
+def import_latencies():
+    latencies = []
+    for project in PROJECTS:
+        pulled = import_dataset(project).query("event == 'pulled'")
+        for latency in ["maintainer", "contributor"]:
+            responded = pulled[pulled[f"{latency}_latency"].notna()]
+            latencies.append(
+                pd.DataFrame(
+                    {
+                        "project": project,
+                        "month": responded["opened_at"].dt.to_period("M").dt.to_timestamp().to_numpy(),
+                        "latency": latency,
+                        "is_bot": responded["is_bot"].to_numpy(bool),
+                        "event": responded[f"{latency}_responded_event"].astype(str).to_numpy(),
+                        "value": responded[f"{latency}_latency"].to_numpy(float),
+                    }
+                )
+            )
+    return pd.concat(latencies, ignore_index=True)
+
+
+def assert_percentiles(percentiles, values):
+    assert percentiles["count"] == len(values)
+    for quantile in QUANTILES:
+        exact = np.quantile(values, quantile, method="lower")
+        assert abs(percentiles[quantile] - exact) <= ACCURACY * max(exact, MINIMUM) * (1 + 1e-9)
+
+
+@pytest.mark.parametrize(
+    "by, filters",
+    [
+        (None, {}),
+        (None, {"latency": "maintainer", "start": "2019-03-01", "end": "2019-06-01"}),
+        ("project", {"latency": "contributor"}),
+        (["latency", "event"], {"is_bot": False}),
+        (["project", "month"], {"latency": "maintainer"}),
+    ],
+)
+def test_query_percentiles(data, by, filters):
+    latencies = import_latencies()
+    cube = import_cube(PROJECTS)
+    selected = pd.Series(True, index=latencies.index)
+    for dimension, value in filters.items():
+        if dimension == "start":
+            selected &= latencies["month"] >= pd.Timestamp(value)
+        elif dimension == "end":
+            selected &= latencies["month"] < pd.Timestamp(value)
+        else:
+            selected &= latencies[dimension] == value
+    latencies = latencies[selected]
+    assert len(latencies) > 10
+    percentiles = query_percentiles(cube, QUANTILES, by=by, **filters)
+    if by is None:
+        assert_percentiles(percentiles, latencies["value"])
+    else:
+        groups = latencies.groupby(list(np.atleast_1d(by)))["value"]
+        assert len(percentiles) == groups.ngroups
+        for key, values in groups:
+            assert_percentiles(percentiles.loc[key if percentiles.index.nlevels > 1 else key[0]], values)
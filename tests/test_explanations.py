@@ -0,0 +1,22 @@
+import catboost
+import numpy as np
+import pandas as pd
+
+from common import get_path
+from explanations import fit_model, hash_parameters
+
+
+def test_fit_model_cache_keyed_by_parameters(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    model = catboost.CatBoostClassifier(objective="MultiClassOneVsAll", random_state=1, thread_count=1, silent=True)
+    assert hash_parameters(model) == hash_parameters(model.copy().set_params(thread_count=4))
+    assert hash_parameters(model) != hash_parameters(model.copy().set_params(random_state=2))
+    assert hash_parameters(model) != hash_parameters(model.copy().set_params(objective="MultiClass"))
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(rng.random((200, 3)), columns=["a", "b", "c"])
+    y = pd.Series(np.array(["x", "y", "z"])[(X["a"] * 3).astype(int)], name="label")
+    first = fit_model(X, y, thread_count=1)
+    files = list(get_path("explanations").glob("model_*.cbm"))
+    assert [file.stem.split("_")[-1] for file in files] == [hash_parameters(model)]
+    np.testing.assert_array_equal(fit_model(X, y, thread_count=2).predict_proba(X), first.predict_proba(X))
+    assert list(get_path("explanations").glob("model_*.cbm")) == files
@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+import pytest
+from conftest import PROJECTS
+
+from common import import_dataset
+from indexes import (
+    PRECISION,
+    backlog_series,
+    count_backlog,
+    count_window_actors,
+    hash_actor,
+    index_backlog,
+    index_history,
+    query_history,
+)
+
+
+def generate_events(size, actors, days, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            "actor": [f"user{actor}" for actor in rng.integers(0, actors, size)],
+            "time": pd.Timestamp(2020, 1, 1) + pd.to_timedelta(np.sort(rng.uniform(0, days * 24, size)), "h"),
+            "is_bot": False,
+            "is_maintainer": rng.random(size) < 0.05,
+        }
+    )
+
+
+def test_hash_actor_ranks():
+    ranks = np.array([hash_actor(f"user{actor}")[1] for actor in range(10_000)])
+    assert ranks.min() == 1
+    assert ranks.max() <= 64 - PRECISION + 1
+    assert abs((ranks == 1).mean() - 0.5) < 0.02
+
+
+def test_count_window_actors_approximate():
+    events = generate_events(400_000, 1_000_000, 180)
+    times = pd.Series(pd.date_range("2020-04-01", "2020-06-30", freq="W"))
+    exact = count_window_actors(events, times)
+    approximate = count_window_actors(events, times, approximate=True)
+    assert exact["project_community"].max() > 150_000
+    errors = (approximate - exact).abs() / exact
+    assert errors.max().max() < 0.1
+    assert errors["project_community"].max() < 0.05
+    assert errors["project_community"].mean() < 0.02
+
+
+def test_count_window_actors_month_ends():
+    events = generate_events(5_000, 100_000, 366)
+    times = pd.Series(pd.date_range("2020-05-29", "2020-06-02", freq="2h"))
+    expected = [
+        events[(events["time"] >= time - pd.DateOffset(months=3)) & (events["time"] < time)]
+        .groupby("is_maintainer")["actor"]
+        .nunique()
+        .reindex([True, False], fill_value=0)
+        .tolist()
+        for time in times
+    ]
+    assert count_window_actors(events, times).to_numpy().tolist() == expected
+    approximate = count_window_actors(events, times, approximate=True)
+    for i in times.index:
+        assert approximate.loc[i].tolist() == count_window_actors(events, times[[i]], approximate=True).iloc[0].tolist()
+
+
+def import_pulled():
+    for project in PROJECTS:
+        dataset = import_dataset(project)
+        yield dataset, dataset.query("event == 'pulled'").droplevel("event_number")
+
+
+def test_query_history_matches_brute_force(data):
+    for _, pulled in import_pulled():
+        history = index_history(pulled)
+        for actor, opened_at in pulled[["actor", "opened_at"]].itertuples(index=False):
+            past = pulled[(pulled["opened_at"] < opened_at) & (pulled["actor"] == actor)]
+            latencies = past.loc[past["contributor_responded_at"] < opened_at, "contributor_latency"].dropna()
+            assert query_history(history, actor, opened_at) == pytest.approx(
+                (
+                    len(past),
+                    (past["is_open"] | (past["resolved_at"] >= opened_at)).sum(),
+                    (past["merged_at"] < opened_at).sum() / len(past) if len(past) else 0,
+                    latencies.median() if len(latencies) else 0,
+                )
+            )
+
+
+def test_count_backlog_matches_brute_force(data):
+    for _, pulled in import_pulled():
+        backlog = index_backlog(pulled)
+        for opened_at in pulled["opened_at"]:
+            past = pulled[pulled["opened_at"] < opened_at]
+            assert count_backlog(backlog, opened_at) == (past["is_open"] | (past["resolved_at"] >= opened_at)).sum()
+        series = backlog_series(backlog)
+        for time, count in series.items():
+            past = pulled[pulled["opened_at"] < time]
+            assert count == (past["is_open"] | (past["resolved_at"] >= time)).sum()
+
+
+def test_count_window_actors_matches_brute_force(data):
+    for dataset, pulled in import_pulled():
+        people = dataset[~dataset["is_bot"]]
+        expected = []
+        for opened_at in pulled["opened_at"]:
+            window = people[(people["time"] >= opened_at - pd.DateOffset(months=3)) & (people["time"] < opened_at)]
+            expected.append(
+                [
+                    window.loc[window["is_maintainer"], "actor"].nunique(),
+                    window.loc[~window["is_maintainer"], "actor"].nunique(),
+                ]
+            )
+        expected = pd.DataFrame(expected, index=pulled.index, columns=["project_maintainers", "project_community"])
+        pd.testing.assert_frame_equal(count_window_actors(dataset, pulled["opened_at"]).loc[pulled.index], expected)
+        # Registers of distinct actors can collide, so approximate counts may undercount small windows by one
+        approximate = count_window_actors(dataset, pulled["opened_at"], approximate=True).loc[pulled.index]
+        assert ((approximate - expected).abs() <= np.maximum(1, 0.05 * expected)).all().all()
@@ -0,0 +1,99 @@
+import json
+import random
+
+import pandas as pd
+import pytest
+from conftest import format_time, generate_patch
+
+from common import (
+    get_path,
+    import_dataset,
+    import_patches,
+    import_pulls,
+    import_timelines,
+    open_commits_store,
+    open_pulls_raw,
+    open_timelines_raw,
+)
+from ingest_events import ingest_events
+from measure_features_maintainers import extract_features_maintainers
+from preprocess_data import preprocess_data
+from process_data import process_data
+
+
+def write_events(file, records):
+    file.write_text("".join(json.dumps({"project": "acme/widget", **record}) + "\n" for record in records))
+    return file
+
+
+def test_ingest_events_raises_reader_errors(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    file = tmp_path / "events.jsonl"
+    file.write_text('{"project": "acme/widget", "pull_number": 1}\n{"project": \n')
+    with pytest.raises(ValueError):
+        ingest_events([file])
+
+
+def test_ingest_events_skips_invalid_pulls(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    pull = {"number": 7, "state": "open", "user": {"login": "alice"}, "created_at": "2020-01-01T00:00:00Z"}
+    commit = {"sha": "a" * 40, "author": {"login": "alice"}}
+    committed = {"event": "committed", "author": {"name": "alice"}, "committer": {"date": "2020-01-01T01:00:00Z"}}
+
+    def ingest(sha):
+        records = [{"pull": pull}, {"commit": commit}, {"event": {**committed, "sha": sha}}]
+        ingest_events([write_events(tmp_path / "events.jsonl", [{"pull_number": 7, **record} for record in records])])
+
+    ingest("b" * 40)
+    with open_pulls_raw("acme/widget") as pulls, open_timelines_raw("acme/widget") as timelines:
+        assert 7 not in pulls and 7 not in timelines
+    with open_commits_store("acme/widget") as store:
+        assert commit["sha"] not in store
+    ingest(commit["sha"])
+    with open_pulls_raw("acme/widget") as pulls, open_timelines_raw("acme/widget") as timelines:
+        assert pulls[7] == pull and len(timelines[7]) == 1
+    with open_commits_store("acme/widget") as store:
+        assert store[commit["sha"]] == commit
+
+
+def test_ingest_events_incremental(collected, processing):
+    project = "acme/widget"
+    preprocess_data(project)
+    process_data(project, **processing)
+    opened_at = pd.Timestamp(import_timelines(project)["time"].max())
+    pull = {
+        "number": 9001,
+        "html_url": f"https://github.com/{project}/pull/9001",
+        "title": "Add streaming",
+        "body": None,
+        "state": "open",
+        "user": {"login": "User1"},
+        "created_at": format_time(opened_at),
+    }
+    commit = {"sha": "c" * 40, "author": {"login": "user1"}}
+    committed = {
+        "event": "committed",
+        "sha": commit["sha"],
+        "author": {"name": "user1"},
+        "committer": {"date": format_time(opened_at - pd.Timedelta(hours=1))},
+    }
+    commented = {"event": "commented", "actor": {"login": "alice"}, "created_at": format_time(opened_at)}
+    records = [
+        {"pull_number": 9001, "pull": pull},
+        {"pull_number": 9001, "commit": commit},
+        {"pull_number": 9001, "patch": generate_patch(commit["sha"], "user1", random.Random(0))},
+        {"pull_number": 9001, "event": committed},
+        {"pull_number": 9001, "event": {**commented, "created_at": format_time(opened_at + pd.Timedelta(hours=2))}},
+        {"pull_number": 3, "event": commented},
+    ]
+    ingest_events([write_events(collected / "events.jsonl", records)])
+    process_data(project, **processing, incremental=True)
+    files = {file: get_path(file, project).read_text() for file in ["timelines", "pulls", "patches"]}
+    dataset = import_dataset(project)
+    assert 9001 in import_pulls(project).index and 9001 in import_patches(project).index
+    features = extract_features_maintainers(project, dataset, import_pulls(project), import_patches(project))
+    assert 9001 in [features["pull_number"] for features in features]
+    preprocess_data(project)
+    process_data(project, **processing)
+    assert {file: get_path(file, project).read_text() for file in files} == files
+    pd.testing.assert_frame_equal(dataset, import_dataset(project))
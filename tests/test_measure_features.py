@@ -0,0 +1,61 @@
+import os
+import shutil
+
+import pandas as pd
+import pytest
+
+import measure_features_contributors
+import measure_features_maintainers
+from common import cleanup_files, get_path, import_dataset, import_patches, import_pulls
+
+EXTRACTORS = {
+    "maintainers": measure_features_maintainers.extract_features_maintainers,
+    "contributors": measure_features_contributors.extract_features_contributors,
+}
+
+
+class Interrupted(Exception):
+    pass
+
+
+def interrupt_after(module, chunks, monkeypatch):
+    append_chunk = module.append_chunk
+    written = []
+
+    def append_interrupted(file, chunk, offset):
+        if len(written) == chunks:
+            raise Interrupted
+        written.append(chunk)
+        return append_chunk(file, chunk, offset)
+
+    monkeypatch.setattr(module, "append_chunk", append_interrupted)
+
+
+@pytest.mark.parametrize("kind", EXTRACTORS)
+def test_extract_features_resumes_only_on_unchanged_inputs(kind, processed, tmp_path, monkeypatch):
+    shutil.copytree(processed, tmp_path, dirs_exist_ok=True)
+    monkeypatch.chdir(tmp_path)
+    module = {"maintainers": measure_features_maintainers, "contributors": measure_features_contributors}[kind]
+    monkeypatch.setattr(module, "CHUNK", 10)
+    extract = EXTRACTORS[kind]
+    project = "acme/widget"
+    dataset, pulls, patches = import_dataset(project), import_pulls(project), import_patches(project)
+    files = [f"checkpoint_{kind}", f"chunks_{kind}"]
+    expected = pd.DataFrame(extract(project, dataset, pulls, patches))
+    cleanup_files(files, True, project)
+
+    with monkeypatch.context() as patched:
+        interrupt_after(module, 3, patched)
+        with pytest.raises(Interrupted):
+            extract(project, dataset, pulls, patches)
+    pd.testing.assert_frame_equal(pd.DataFrame(extract(project, dataset, pulls, patches)), expected)
+    cleanup_files(files, True, project)
+
+    stale = dataset.assign(actor="someone")
+    with monkeypatch.context() as patched:
+        interrupt_after(module, 3, patched)
+        with pytest.raises(Interrupted):
+            extract(project, stale, pulls, patches)
+    path = get_path("dataset_events", project)
+    os.utime(path, ns=(path.stat().st_atime_ns, path.stat().st_mtime_ns + 1))
+    pd.testing.assert_frame_equal(pd.DataFrame(extract(project, dataset, pulls, patches)), expected)
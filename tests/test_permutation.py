@@ -0,0 +1,50 @@
+import shutil
+
+import catboost
+import numpy as np
+import pandas as pd
+import sklearn.calibration
+import sklearn.frozen
+import sklearn.inspection
+import sklearn.metrics
+from conftest import PROJECTS
+
+from common import import_features_maintainers
+from measure_features_maintainers import measure_features_maintainers
+from permutation import permutation_importances
+from predict_latency import characteristics, labels
+
+
+def test_permutation_importances_match_sklearn(processed, tmp_path, monkeypatch):
+    shutil.copytree(processed, tmp_path, dirs_exist_ok=True)
+    monkeypatch.chdir(tmp_path)
+    features = []
+    for project in PROJECTS:
+        measure_features_maintainers(project)
+        features.append(import_features_maintainers(project).dropna(subset=["maintainer_latency", *characteristics]))
+    features = pd.concat(features)
+    features["label"] = pd.cut(features["maintainer_latency"], [-np.inf, 24, 168, np.inf], labels=labels).astype(str)
+    train, test = features.query("project == 'acme/widget'"), features.query("project == 'acme/gadget'")
+    model = catboost.CatBoostClassifier(
+        objective="MultiClassOneVsAll", iterations=50, random_state=1, thread_count=1, silent=True
+    ).fit(train[characteristics], train["label"])
+    model = sklearn.calibration.CalibratedClassifierCV(sklearn.frozen.FrozenEstimator(model), method="isotonic").fit(
+        train[characteristics], train["label"]
+    )
+    X, y = test[characteristics], test["label"]
+    assert y.nunique() == len(labels)
+    scorers = {
+        "roc_auc_ovr": "roc_auc_ovr",
+        "average_precision_ovr": sklearn.metrics.make_scorer(
+            sklearn.metrics.average_precision_score, response_method="predict_proba"
+        ),
+    }
+    importances = permutation_importances(model, X, y, {name: name for name in scorers}, n_repeats=5, random_state=3)
+    expected = sklearn.inspection.permutation_importance(model, X, y, scoring=scorers, n_repeats=5, random_state=3)
+    for name in scorers:
+        assert np.abs(importances[name]).max() > 0
+        np.testing.assert_allclose(importances[name], expected[name]["importances"], atol=1e-12)
+    accuracy = {"accuracy": lambda y, probabilities: np.mean(model.classes_[probabilities.argmax(axis=1)] == y)}
+    importances = permutation_importances(model, X, y, accuracy, n_repeats=5, random_state=3)
+    expected = sklearn.inspection.permutation_importance(model, X, y, scoring="accuracy", n_repeats=5, random_state=3)
+    np.testing.assert_allclose(importances["accuracy"], expected["importances"], atol=1e-12)
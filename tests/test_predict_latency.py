@@ -0,0 +1,35 @@
+import itertools
+import shutil
+
+import pandas as pd
+from conftest import PROJECTS
+
+from common import import_features_maintainers
+from measure_features_maintainers import measure_features_maintainers
+from predict_latency import (
+    characteristics,
+    collect_features,
+    create_state,
+    import_state_events,
+    ingest_events,
+    load_state,
+)
+
+
+def test_replay_matches_features(processed, processing, tmp_path, monkeypatch):
+    shutil.copytree(processed, tmp_path, dirs_exist_ok=True)
+    monkeypatch.chdir(tmp_path)
+    for project in PROJECTS:
+        measure_features_maintainers(project)
+        features = import_features_maintainers(project)
+        expected = features[characteristics].dropna()
+        assert len(expected) > len(features) / 2
+        replayed = collect_features(load_state(project, **processing))
+        assert replayed.index.sort_values().equals(features.index)
+        pd.testing.assert_frame_equal(replayed.loc[expected.index], expected, check_dtype=False)
+        state = create_state(project, **processing)
+        streamed = [
+            ingest_events(state, list(events))
+            for _, events in itertools.groupby(import_state_events(project), key=lambda event: event["time"].date())
+        ]
+        pd.testing.assert_frame_equal(pd.concat(streamed).loc[expected.index], expected, check_dtype=False)
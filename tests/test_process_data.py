@@ -0,0 +1,31 @@
+import shutil
+
+import pandas as pd
+import pytest
+from conftest import PROJECTS
+
+from common import get_path, import_dataset
+from process_data import process_data, verify_incremental
+
+
+@pytest.mark.parametrize("steps", [2, 5])
+@pytest.mark.parametrize("project", PROJECTS)
+def test_verify_incremental(data, processing, project, steps):
+    assert verify_incremental(project, steps=steps, **processing)
+
+
+def test_process_data_incremental(processed, processing, tmp_path, monkeypatch):
+    shutil.copytree(processed, tmp_path, dirs_exist_ok=True)
+    monkeypatch.chdir(tmp_path)
+    project = "acme/widget"
+    timelines = pd.read_csv(get_path("timelines", project), low_memory=False)
+    closed = timelines.query("event == 'closed'")["pull_number"].unique()
+    changed = (timelines["pull_number"].isin(closed[:5]) & timelines["event"].isin(["closed", "merged"])) | (
+        timelines["pull_number"] == closed[-1]
+    )
+    timelines[~changed].to_csv(get_path("timelines", project), index=False)
+    process_data(project, incremental=True, **processing)
+    incremental = import_dataset(project)
+    assert not incremental.index.get_level_values("pull_number").isin([closed[-1]]).any()
+    process_data(project, **processing)
+    pd.testing.assert_frame_equal(incremental, import_dataset(project), check_categorical=False)
@@ -0,0 +1,32 @@
+import pytest
+
+from scheduling import RATE, export_history, import_history, predict_memory, predict_time
+
+
+def test_predict_time_from_history(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert import_history("process_data") == []
+    assert predict_time([], 2**20) == pytest.approx(RATE * 2**20)
+    records = [
+        {
+            "stage": "process_data",
+            "project": f"acme/{size}",
+            "size": size,
+            "predicted": 0,
+            "peak": peak,
+            "elapsed": elapsed,
+        }
+        for size, peak, elapsed in [(1000, 2**29, 2.0), (2000, 2**29 + 4000, 4.0), (4000, 2**29 + 8000, 8.0)]
+    ]
+    export_history(records)
+    export_history([{**records[0], "stage": "preprocess_data", "elapsed": 100.0}])
+    history = import_history("process_data")
+    assert history == [(1000, 2**29, 2.0), (2000, 2**29 + 4000, 4.0), (4000, 2**29 + 8000, 8.0)]
+    assert predict_memory(history, 3000) == 2**29 + 6000
+    assert predict_time(history, 3000) == pytest.approx(2.0 + 3000 * 6.0 / 4000)
+    sizes = {"acme/small": 500, "acme/large": 8000, "acme/medium": 3000}
+    assert sorted(sizes, key=lambda project: predict_time(history, sizes[project]), reverse=True) == [
+        "acme/large",
+        "acme/medium",
+        "acme/small",
+    ]
@@ -0,0 +1,21 @@
+import pandas as pd
+from conftest import PROJECTS
+
+from common import get_path
+from predict_latency import import_state_events, load_state
+from snapshots import build_snapshots, open_snapshots, query_features, read_snapshot
+
+
+def test_query_features(data, processing):
+    for project in PROJECTS:
+        build_snapshots(project, **processing, replay=100)
+        snapshots = open_snapshots(project)
+        index = pd.read_parquet(get_path("snapshots_index", project))
+        daily = pd.Series(1, index=[event["time"] for event in import_state_events(project)]).resample("D").sum()
+        assert len(index) > 2 and index["events"].max() < 100 + daily.max()
+        for time in index["time"]:
+            state, events = read_snapshot(snapshots, time)
+            assert set(state["pulls"]) <= {event["pull_number"] for event in events}
+        state = load_state(project, **processing)
+        for pull_number, features in state["features"].items():
+            assert query_features(snapshots, pull_number).to_dict() == features